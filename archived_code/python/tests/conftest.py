@@ -4,3 +4,11 @@ pytest.ini_options = {
     "asyncio_mode": "auto",
     "asyncio_default_fixture_loop_scope": "function"
 }
+
+@pytest.fixture(autouse=True, scope="session")
+def listing_cache_dir(tmp_path_factory):
+    """Keep listing caches written during the tests out of the user's cache directory"""
+    monkeypatch = pytest.MonkeyPatch()
+    monkeypatch.setenv("ZETTELFILES_CACHE_DIR", str(tmp_path_factory.mktemp("listing_cache")))
+    yield
+    monkeypatch.undo()
@@ -0,0 +1,63 @@
+import os
+import stat
+import pytest
+from zettelfiles.atomic_ops import atomic_write
+
+def test_atomic_write_follows_symlinks(tmp_path):
+    """Test that writing through a symlink replaces its target and keeps the link"""
+    target = tmp_path / "target.md"
+    target.write_text("old")
+    link = tmp_path / "link.md"
+    link.symlink_to(target)
+
+    atomic_write(str(link), "new")
+
+    assert link.is_symlink()
+    assert target.read_text() == "new"
+
+def test_atomic_write_keeps_hard_links(tmp_path):
+    """Test that a file with other hard links is overwritten in place"""
+    note = tmp_path / "note.md"
+    note.write_text("old")
+    other = tmp_path / "other.md"
+    os.link(note, other)
+
+    atomic_write(str(note), b"new")
+
+    assert other.read_bytes() == b"new"
+    assert os.path.samefile(note, other)
+    assert sorted(os.listdir(tmp_path)) == ["note.md", "other.md"]
+
+def test_atomic_write_keeps_mode(tmp_path):
+    """Test that the replaced file keeps the mode of the original"""
+    note = tmp_path / "note.md"
+    note.write_text("old")
+    note.chmod(0o640)
+
+    atomic_write(str(note), "new")
+
+    assert stat.S_IMODE(note.stat().st_mode) == 0o640
+    assert note.read_text() == "new"
+
+@pytest.mark.skipif(not hasattr(os, "geteuid") or os.geteuid() != 0, reason="needs root to chown")
+def test_atomic_write_keeps_owner(tmp_path):
+    """Test that the replaced file keeps the owner and group of the original"""
+    note = tmp_path / "note.md"
+    note.write_text("old")
+    os.chown(note, 1234, 5678)
+
+    atomic_write(str(note), "new")
+
+    assert (note.stat().st_uid, note.stat().st_gid) == (1234, 5678)
+    assert note.read_text() == "new"
+
+def test_atomic_write_new_file_follows_umask(tmp_path):
+    """Test that a new file gets 0666 less the process umask, and no temporary file is left"""
+    old_umask = os.umask(0o027)
+    try:
+        atomic_write(str(tmp_path / "new.md"), "new")
+    finally:
+        os.umask(old_umask)
+
+    assert stat.S_IMODE((tmp_path / "new.md").stat().st_mode) == 0o640
+    assert os.listdir(tmp_path) == ["new.md"]
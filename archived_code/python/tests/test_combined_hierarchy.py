@@ -2,8 +2,10 @@ import pytest
 import os
 import tempfile
 import shutil
+import json
 from zettelfiles.get_hierarchy import build_combined_graph, combined_graph_to_dict
 from zettelfiles.utils import is_valid_node_id
+from zettelfiles.file_graph import FileGraph
 
 @pytest.fixture
 def test_dir():
@@ -166,3 +168,31 @@ def test_id_file_detection(test_dir):
         folder_node = graph["nodes"][folder_path]
         self.assertTrue(folder_node["is_directory"])
         self.assertEqual(folder_node["name"], "Regular Folder")
+
+def test_graph_views_merge_into_full_graph(test_dir):
+    """Test that depth-limited views of a FileGraph merge back into the full graph"""
+    os.makedirs(os.path.join(test_dir, "Regular Folder", "Nested"))
+    with open(os.path.join(test_dir, "Regular Folder", "Nested", "01a01 Deep.md"), "w") as f:
+        f.write("Deep note whose Folgezettel parent is at the root")
+    graph = FileGraph()
+    graph.build_from_directory(test_dir)
+    full = json.loads(graph.to_json_sorted())
+
+    top = json.loads(graph.to_json_view(max_depth=0))
+    stubs = [n["path"] for n in top["nodes"].values() if n.get("has_children")]
+    assert stubs == ["Regular Folder"]
+
+    nodes, edges = {}, {}
+    for path in [".", "Regular Folder", os.path.join("Regular Folder", "Nested")]:
+        view = json.loads(graph.to_json_view(path, 0))
+        for key, node in view["nodes"].items():
+            node.pop("has_children", None)
+            assert node == full["nodes"][key]
+            nodes[key] = node
+        for parent, children in view["edges"].items():
+            edges.setdefault(parent, set()).update(children)
+    assert nodes == full["nodes"]
+    assert {parent: sorted(children) for parent, children in edges.items()} == full["edges"]
+
+    with pytest.raises(ValueError):
+        graph.to_json_view("..")
@@ -0,0 +1,143 @@
+import os
+import pytest
+from watchdog.events import (
+    FileCreatedEvent, FileDeletedEvent, FileMovedEvent, FileModifiedEvent, DirCreatedEvent,
+)
+from zettelfiles.error_handling import InconsistentGraph
+from zettelfiles.file_graph import FileGraph, GraphPatch
+from zettelfiles.graph_manager import GraphManager
+
+@pytest.fixture
+def vault(tmp_path):
+    """A small vault with ID notes, a folder and a plain note"""
+    (tmp_path / "Folder").mkdir()
+    files = {
+        "01 Root.md": "root",
+        "01a Child.md": "child",
+        "Folder/02 Inside.md": "inside",
+        "Folder/plain.md": "plain",
+    }
+    for fname, content in files.items():
+        (tmp_path / fname).write_text(content)
+    return tmp_path
+
+def build(directory):
+    graph = FileGraph()
+    graph.build_from_directory(str(directory))
+    return graph
+
+def snapshot(graph):
+    """Nodes and edges keyed by relative path, so patched and rebuilt graphs compare equal"""
+    data = graph.to_dict_sorted()
+    key = lambda s: s if s.startswith(("dir_", "surrogate_")) else graph.rel_path(s)
+    nodes = {key(k): v for k, v in data["nodes"].items()}
+    edges = {key(k): sorted(key(c) for c in v) for k, v in data["edges"].items() if v}
+    return nodes, edges
+
+def create(vault):
+    (vault / "01b New.md").write_text("new")
+    return [FileCreatedEvent(str(vault / "01b New.md"))]
+
+def delete(vault):
+    (vault / "Folder" / "plain.md").unlink()
+    return [FileDeletedEvent(str(vault / "Folder" / "plain.md"))]
+
+def move(vault):
+    os.rename(vault / "01a Child.md", vault / "Folder" / "03 Child.md")
+    return [FileMovedEvent(str(vault / "01a Child.md"), str(vault / "Folder" / "03 Child.md"))]
+
+def modify(vault):
+    (vault / "01 Root.md").write_text("root, edited")
+    return [FileModifiedEvent(str(vault / "01 Root.md"))]
+
+def create_then_delete(vault):
+    events = create(vault)
+    (vault / "01b New.md").unlink()
+    return events + [FileDeletedEvent(str(vault / "01b New.md"))]
+
+@pytest.mark.parametrize("change", [create, delete, move, modify, create_then_delete])
+def test_update_from_change_matches_rebuild(vault, change):
+    """Test that patching the graph for watcher events gives the graph a fresh scan builds"""
+    graph = build(vault)
+    for event in change(vault):
+        graph.update_from_change(event)
+    assert snapshot(graph) == snapshot(build(vault))
+
+def test_find_file_follows_moves(vault):
+    """Test that find_file looks files up at their current path only"""
+    graph = build(vault)
+    stable_id = graph.find_file(str(vault / "01a Child.md"))
+    assert stable_id == graph.folgezettel_to_stable["01a"]
+    assert graph.find_file(str(vault / "Folder" / "plain.md")) is not None
+    assert graph.find_file(str(vault / "Folder")) is None
+
+    for event in move(vault):
+        graph.update_from_change(event)
+    assert graph.find_file(str(vault / "01a Child.md")) is None
+    assert graph.find_file(str(vault / "Folder" / "03 Child.md")) == stable_id
+
+    graph.names[stable_id] = "Renamed"
+    assert graph.find_file(str(vault / "Folder" / "03 Renamed.md")) == stable_id
+    graph.remove_node(stable_id)
+    assert graph.find_file(str(vault / "Folder" / "03 Renamed.md")) is None
+
+def test_apply_patch_matches_rebuild(vault):
+    """Test that a patch describing a rename, a move and a new file gives a fresh scan's graph"""
+    graph = build(vault)
+    root = graph.folgezettel_to_stable["01"]
+    child = graph.folgezettel_to_stable["01a"]
+    os.rename(vault / "01 Root.md", vault / "01 Top.md")
+    os.rename(vault / "01a Child.md", vault / "Folder" / "02a Child.md")
+    (vault / "Folder" / "02b New.md").write_text("new")
+
+    graph.apply_patch(GraphPatch(
+        created=[str(vault / "Folder" / "02b New.md")],
+        moved=[(child, "Folder", "02a")],
+        renamed=[(root, "Top")],
+    ))
+    assert snapshot(graph) == snapshot(build(vault))
+
+def test_apply_patch_rejects_unknown_nodes(vault):
+    """Test that patches naming nodes the graph doesn't have raise InconsistentGraph"""
+    graph = build(vault)
+    with pytest.raises(InconsistentGraph):
+        graph.apply_patch(GraphPatch(deleted=["missing"]))
+    with pytest.raises(InconsistentGraph):
+        graph.apply_patch(GraphPatch(renamed=[("missing", "Name")]))
+
+def test_directory_event_falls_back_to_rebuild(vault):
+    """Test that directory events raise InconsistentGraph and the manager rebuilds instead"""
+    manager = GraphManager()
+    manager.initialize_graph(str(vault))
+    (vault / "New Folder").mkdir()
+    (vault / "New Folder" / "04 Deep.md").write_text("deep")
+    event = DirCreatedEvent(str(vault / "New Folder"))
+
+    with pytest.raises(InconsistentGraph):
+        build(vault).update_from_change(event)
+
+    manager.update_graph(event)
+    assert snapshot(manager.graph) == snapshot(build(vault))
+    assert manager.graph.find_file(str(vault / "New Folder" / "04 Deep.md")) is not None
+
+def test_inconsistent_patch_falls_back_to_rebuild(vault):
+    """Test that the manager rebuilds from disk when a patch doesn't fit the graph"""
+    manager = GraphManager()
+    manager.initialize_graph(str(vault))
+    (vault / "05 Other.md").write_text("other")
+
+    manager.apply_patch(GraphPatch(deleted=["missing"]))
+    assert snapshot(manager.graph) == snapshot(build(vault))
+
+def test_column_writes_refresh_rel_path(vault):
+    """Test that writing through the column views invalidates memoized paths"""
+    graph = build(vault)
+    stable_id = graph.folgezettel_to_stable["01"]
+    assert graph.rel_path(stable_id) == "01 Root.md"
+
+    graph.names[stable_id] = "Renamed"
+    graph.paths[stable_id] = "Folder"
+    assert graph.rel_path(stable_id) == os.path.join("Folder", "01 Renamed.md")
+
+    graph.folgezettel_ids[stable_id] = "05"
+    assert graph.rel_path(stable_id) == os.path.join("Folder", "05 Renamed.md")
@@ -2,7 +2,9 @@ import pytest
 import os
 import shutil
 from pathlib import Path
-from zettelfiles.file_operations import move_files, get_file_paths, create_file
+from zettelfiles.file_operations import move_files, get_file_paths, create_file, change_folgezettel_ids
+from zettelfiles.file_graph import FileGraph
+from zettelfiles.zettelrename import rename_and_update_links
 from zettelfiles.file_manager import FileManager
 from zettelfiles.graph_manager import GraphManager
 from zettelfiles.utils import get_next_available_child_id, get_stable_id_from_folgezettel
@@ -429,3 +431,161 @@ class TestFileManagerIntegration:
         moved_node = graph.nodes[source_stable_id]
         assert moved_node['id'] == '01c'
         assert moved_node['path'] == os.path.relpath(target_dir, test_dir)
+
+def test_change_folgezettel_ids_with_links_inside_subtree(tmp_path):
+    """Test that notes of a renamed subtree that link to each other get their links updated"""
+    files = {
+        "01a A.md": "Child: [[01a01 B|bee]]",
+        "01a01 B.md": "Parent: [[01a A]] and [[01a]]",
+        "02 Other.md": "[[01a A]] [[01a01 B]]",
+    }
+    for fname, content in files.items():
+        (tmp_path / fname).write_text(content)
+    graph = FileGraph()
+    graph.build_from_directory(str(tmp_path))
+
+    success, updated_files = change_folgezettel_ids(str(tmp_path), "01a", "01b", graph)
+
+    assert success
+    assert (tmp_path / "01b A.md").read_text() == "Child: [[01b01 B|bee]]"
+    assert (tmp_path / "01b01 B.md").read_text() == "Parent: [[01b A]] and [[01b]]"
+    assert (tmp_path / "02 Other.md").read_text() == "[[01b A]] [[01b01 B]]"
+    assert sorted(map(os.path.basename, updated_files)) == ["01b A.md", "01b01 B.md", "02 Other.md"]
+
+def test_move_files_rolls_back_when_a_source_fails(tmp_path, monkeypatch):
+    """Test that a failure on the second source restores the files, links and graph of the first"""
+    (tmp_path / "Sub").mkdir()
+    files = {
+        "Sub/01 Target.md": "target",
+        "02 First.md": "first",
+        "03 Second.md": "second",
+        "04 Links.md": "[[02 First]] [[03 Second|two]]",
+    }
+    for fname, content in files.items():
+        (tmp_path / fname).write_text(content)
+    graph = FileGraph()
+    graph.build_from_directory(str(tmp_path))
+    before = graph.to_dict_sorted()
+    first = graph.folgezettel_to_stable["02"]
+    second = graph.folgezettel_to_stable["03"]
+    target = graph.folgezettel_to_stable["01"]
+
+    def rename_first_only(base_dir, old_path, new_path, *args):
+        if os.path.basename(old_path) == "03 Second.md":
+            raise OSError("disk full")
+        return rename_and_update_links(base_dir, old_path, new_path, *args)
+    monkeypatch.setattr("zettelfiles.file_operations.rename_and_update_links", rename_first_only)
+
+    success, updated_files, graph, patch = move_files(str(tmp_path), [first, second], target, graph)
+
+    assert not success
+    assert updated_files == [] and not patch
+    assert sorted(p.relative_to(tmp_path).as_posix() for p in tmp_path.rglob("*.md")) == sorted(files)
+    for fname, content in files.items():
+        assert (tmp_path / fname).read_text() == content
+    assert graph.to_dict_sorted() == before
+
+@pytest.mark.asyncio
+async def test_rename_file_rekeys_linking_notes(file_manager, test_dir):
+    """Test that notes whose links a rename rewrote keep matching the stable IDs on disk"""
+    success, updated_files = await file_manager.rename_file(
+        str(test_dir / "20230101 First Note.md"),
+        str(test_dir / "20230101 Updated Note.md")
+    )
+    assert success and updated_files
+
+    graph = file_manager.graph_manager.graph
+    fresh = FileGraph()
+    fresh.build_from_directory(str(test_dir))
+    assert graph.to_dict_sorted()["nodes"] == fresh.to_dict_sorted()["nodes"]
+    assert graph.to_dict_sorted()["edges"] == fresh.to_dict_sorted()["edges"]
+
+@pytest.mark.asyncio
+async def test_move_files_prunes_surrogate_parents(tmp_path):
+    """Test that moving a note off its surrogate parents leaves the graph a fresh scan builds"""
+    (tmp_path / "02 Target.md").write_text("target")
+    (tmp_path / "01a01 Orphan.md").write_text("orphan")
+    graph_manager = GraphManager()
+    graph = graph_manager.initialize_graph(str(tmp_path))
+    assert "surrogate_01a" in graph.all_nodes
+
+    success, _ = await FileManager(graph_manager).move_files(
+        [graph.folgezettel_to_stable["01a01"]], graph.folgezettel_to_stable["02"]
+    )
+
+    assert success
+    fresh = FileGraph()
+    fresh.build_from_directory(str(tmp_path))
+    graph = graph_manager.graph
+    assert "surrogate_01" not in graph.all_nodes and "surrogate_01a" not in graph.all_nodes
+    assert graph.to_dict_sorted()["nodes"] == fresh.to_dict_sorted()["nodes"]
+    assert graph.to_dict_sorted()["edges"] == fresh.to_dict_sorted()["edges"]
+
+def test_move_files_rollback_restores_surrogate_parents(tmp_path, monkeypatch):
+    """Test that a failed move puts back the surrogates an earlier source was moved off"""
+    files = ["02 Target.md", "01a01 Orphan.md", "03 Other.md"]
+    for fname in files:
+        (tmp_path / fname).write_text(fname)
+    graph = FileGraph()
+    graph.build_from_directory(str(tmp_path))
+    before = graph.to_dict_sorted()
+    orphan = graph.folgezettel_to_stable["01a01"]
+    other = graph.folgezettel_to_stable["03"]
+
+    def rename_first_only(base_dir, old_path, new_path, *args):
+        if os.path.basename(old_path) == "03 Other.md":
+            raise OSError("disk full")
+        return rename_and_update_links(base_dir, old_path, new_path, *args)
+    monkeypatch.setattr("zettelfiles.file_operations.rename_and_update_links", rename_first_only)
+
+    success, _, graph, _ = move_files(str(tmp_path), [orphan, other], graph.folgezettel_to_stable["02"], graph)
+
+    assert not success
+    assert sorted(os.listdir(tmp_path)) == sorted(files)
+    after = graph.to_dict_sorted()
+    assert after["nodes"] == before["nodes"] and after["edges"] == before["edges"]
+
+@pytest.mark.asyncio
+async def test_move_files_reports_linking_sources_at_their_new_paths(tmp_path, monkeypatch):
+    """Test that a source linking to an earlier source of the batch is patched at its new path"""
+    files = {"02 Target.md": "target", "03 A.md": "a", "04 B.md": "See [[03 A]]"}
+    for fname, content in files.items():
+        (tmp_path / fname).write_text(content)
+    graph_manager = GraphManager()
+    graph = graph_manager.initialize_graph(str(tmp_path))
+    def no_rebuild():
+        raise AssertionError("move fell back to a rebuild")
+    monkeypatch.setattr(graph_manager, "update_graph", no_rebuild)
+
+    success, updated_files = await FileManager(graph_manager).move_files(
+        [graph.folgezettel_to_stable["03"], graph.folgezettel_to_stable["04"]],
+        graph.folgezettel_to_stable["02"]
+    )
+
+    assert success
+    assert updated_files == [str(tmp_path / "02b B.md")]
+    assert (tmp_path / "02b B.md").read_text() == "See [[02a A]]"
+    fresh = FileGraph()
+    fresh.build_from_directory(str(tmp_path))
+    assert graph_manager.graph.to_dict_sorted()["nodes"] == fresh.to_dict_sorted()["nodes"]
+
+def test_move_files_rollback_restores_links_in_moved_sources(tmp_path, monkeypatch):
+    """Test that rolling back restores links in a source that had moved after they were rewritten"""
+    files = {"02 Target.md": "target", "03 A.md": "a", "04 B.md": "See [[03 A]]", "05 C.md": "c"}
+    for fname, content in files.items():
+        (tmp_path / fname).write_text(content)
+    graph = FileGraph()
+    graph.build_from_directory(str(tmp_path))
+    sources = [graph.folgezettel_to_stable[i] for i in ("03", "04", "05")]
+
+    def fail_on_last(base_dir, old_path, new_path, *args):
+        if os.path.basename(old_path) == "05 C.md":
+            raise OSError("disk full")
+        return rename_and_update_links(base_dir, old_path, new_path, *args)
+    monkeypatch.setattr("zettelfiles.file_operations.rename_and_update_links", fail_on_last)
+
+    success, _, _, _ = move_files(str(tmp_path), sources, graph.folgezettel_to_stable["02"], graph)
+
+    assert not success
+    for fname, content in files.items():
+        assert (tmp_path / fname).read_text() == content
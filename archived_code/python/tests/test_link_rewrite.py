@@ -0,0 +1,89 @@
+import os
+import tracemalloc
+import pytest
+from zettelfiles.zettelrename import (
+    STREAM_THRESHOLD, find_links_to_files, rename_and_update_links, update_links_in_file,
+)
+
+# (note text, text after renaming [[01 Note]] to [[02 Renamed]])
+LINK_CASES = [
+    (b"See [[01 Note]].", b"See [[02 Renamed]]."),
+    (b"See [[01]].", b"See [[02]]."),
+    (b"See [[01 Note|the note]].", b"See [[02 Renamed|the note]]."),
+    (b"See [[01 Note|]].", b"See [[02 Renamed|]]."),
+    (b"[[01 Note]] [[01]] [[01 Note|alt]]", b"[[02 Renamed]] [[02]] [[02 Renamed|alt]]"),
+    (b"one\r\n[[01 Note]]\r\ntwo [[01 Note|alt]]\r\n", b"one\r\n[[02 Renamed]]\r\ntwo [[02 Renamed|alt]]\r\n"),
+    (b"[[01 Note|never closed\n[[01 Note]]", b"[[01 Note|never closed\n[[02 Renamed]]"),
+    (b"caf\xe9 \xff [[01 Note]]", b"caf\xe9 \xff [[02 Renamed]]"),
+    (b"[[01a]] [[01 Notes]] [[010]] [[01 Note", b"[[01a]] [[01 Notes]] [[010]] [[01 Note"),
+]
+
+@pytest.mark.parametrize("big", [False, True], ids=["read", "mmap"])
+@pytest.mark.parametrize("content, expected", LINK_CASES)
+def test_update_links_in_file(tmp_path, content, expected, big):
+    """Test each link form, with the note read whole or rewritten from a memory map"""
+    # Big notes are padded past the threshold, with a line break so padding can't join a link
+    padding = b"x" * STREAM_THRESHOLD + b"\n" if big else b""
+    note = tmp_path / "note.md"
+    note.write_bytes(padding + content)
+
+    changed = update_links_in_file(str(note), "01", "Note", "02", "Renamed")
+
+    assert changed == (content != expected)
+    assert note.read_bytes() == padding + expected
+
+def test_big_note_is_not_copied_into_memory(tmp_path):
+    """Test that rewriting a mapped note doesn't build a copy of it"""
+    note = tmp_path / "note.md"
+    note.write_bytes(b"x" * (16 * STREAM_THRESHOLD) + b"\n[[01 Note|alt]] [[01]]\n")
+
+    tracemalloc.start()
+    try:
+        assert update_links_in_file(str(note), "01", "Note", "02", "Renamed")
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert peak < STREAM_THRESHOLD
+    assert note.read_bytes().endswith(b"\n[[02 Renamed|alt]] [[02]]\n")
+
+@pytest.mark.parametrize("extension", [".md", ".MD", ".txt"])
+def test_rename_updates_links_by_extension(tmp_path, extension):
+    """Test that renames update links in notes whatever the case of their extension"""
+    (tmp_path / f"01 Note{extension}").write_text("note")
+    linking = tmp_path / f"Links{extension}"
+    linking.write_bytes(b"[[01 Note]]\r\n[[01 Note|alt]]\r\n")
+
+    success, updated = rename_and_update_links(
+        str(tmp_path), str(tmp_path / f"01 Note{extension}"), str(tmp_path / f"02 Renamed{extension}"),
+        "01", "Note", "02", "Renamed"
+    )
+
+    assert success
+    assert updated == [str(linking)]
+    assert linking.read_bytes() == b"[[02 Renamed]]\r\n[[02 Renamed|alt]]\r\n"
+    assert (tmp_path / f"02 Renamed{extension}").exists()
+
+def test_find_links_to_files(tmp_path):
+    """Test that the --json batch search attributes each file to the targets it links to"""
+    (tmp_path / "Sub").mkdir()
+    files = {
+        "both.md": b"[[01 One]] and [[02]]",
+        "one.MD": b"[[01 One|alt]]",
+        "Sub/two.txt": b"[[02 Two]]",
+        "none.md": b"[[03 Three]] [[01 Ones]]",
+        "skipped.pdf": b"[[01 One]]",
+    }
+    for fname, content in files.items():
+        (tmp_path / fname).write_bytes(content)
+    # A name that isn't valid UTF-8 comes back from ripgrep base64-encoded
+    undecodable = os.path.join(str(tmp_path).encode(), b"caf\xe9.md")
+    with open(undecodable, "wb") as f:
+        f.write(b"[[02 Two]]")
+
+    found = find_links_to_files(str(tmp_path), [("01", "One"), ("02", "Two"), ("04", "Four")])
+
+    rel = lambda paths: sorted(os.path.relpath(p, tmp_path) for p in paths)
+    assert rel(found[("01", "One")]) == ["both.md", "one.MD"]
+    assert rel(found[("02", "Two")]) == sorted(["both.md", os.path.join("Sub", "two.txt"), os.fsdecode(b"caf\xe9.md")])
+    assert found[("04", "Four")] == []
@@ -0,0 +1,67 @@
+import os
+import time
+import pytest
+from zettelfiles.get_hierarchy import build_combined_graph
+from zettelfiles.scan_cache import ListingCache, get_cache_dir, prune_cache_dir, RACY_WINDOW_NS
+
+def note_names(graph):
+    return sorted(n["name"] for n in graph["nodes"].values() if not n["is_directory"])
+
+def set_mtime(path, mtime_ns):
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+@pytest.fixture
+def vault(tmp_path):
+    """A vault whose folder was last changed well outside the racy window"""
+    (tmp_path / "01 First.md").write_text("first")
+    set_mtime(tmp_path, time.time_ns() - 10 * RACY_WINDOW_NS)
+    return tmp_path
+
+def test_cache_dir_is_isolated():
+    """Test that the test suite doesn't write listing caches into the home directory"""
+    assert not get_cache_dir().startswith(os.path.expanduser("~/.cache"))
+
+def test_unchanged_directory_reuses_listing(vault):
+    """Test that a folder with the same mtime is not listed again"""
+    assert note_names(build_combined_graph(str(vault), use_cache=True)) == ["First"]
+
+    # A new file with the folder's mtime put back is only seen by reading the folder
+    mtime_ns = os.stat(vault).st_mtime_ns
+    (vault / "02 Second.md").write_text("second")
+    set_mtime(vault, mtime_ns)
+
+    assert note_names(build_combined_graph(str(vault), use_cache=True)) == ["First"]
+    assert note_names(build_combined_graph(str(vault))) == ["First", "Second"]
+
+def test_changed_directory_is_listed_again(vault):
+    """Test that a folder whose mtime changed is not taken from the cache"""
+    build_combined_graph(str(vault), use_cache=True)
+
+    (vault / "02 Second.md").write_text("second")
+    assert note_names(build_combined_graph(str(vault), use_cache=True)) == ["First", "Second"]
+
+def test_recently_changed_directory_is_not_cached(tmp_path):
+    """Test that a folder changed within the racy window is listed again even with the same mtime"""
+    (tmp_path / "01 First.md").write_text("first")
+    mtime_ns = time.time_ns() - RACY_WINDOW_NS // 4
+    set_mtime(tmp_path, mtime_ns)
+    build_combined_graph(str(tmp_path), use_cache=True)
+
+    (tmp_path / "02 Second.md").write_text("second")
+    set_mtime(tmp_path, mtime_ns)
+
+    assert note_names(build_combined_graph(str(tmp_path), use_cache=True)) == ["First", "Second"]
+
+def test_prune_keeps_most_recent_caches(tmp_path):
+    """Test that only the most recently saved caches are kept"""
+    cache_dir = tmp_path / "cache"
+    for i in range(5):
+        cache = ListingCache(str(tmp_path / f"vault{i}"), str(cache_dir))
+        cache.save()
+        set_mtime(cache.path, i * RACY_WINDOW_NS)
+    (cache_dir / "unrelated.pkl").write_text("")
+
+    prune_cache_dir(str(cache_dir), keep=2)
+
+    kept = {ListingCache(str(tmp_path / f"vault{i}"), str(cache_dir)).path for i in (3, 4)}
+    assert {str(p) for p in cache_dir.iterdir()} == kept | {str(cache_dir / "unrelated.pkl")}
@@ -1,7 +1,9 @@
 import os
 import shutil
+import subprocess
 import tempfile
 import unittest
+from unittest import mock
 from zettelfiles.zettelrename import rename_and_update_links
 
 class TestZettelRename(unittest.TestCase):
@@ -166,5 +168,28 @@ class TestZettelRename(unittest.TestCase):
             self.assertIn("[[01b01 New Name|Alias]]", content)
             self.assertNotIn("[[01a Original Name|Alias]]", content)
 
+    def test_failed_rename_stops_ripgrep(self):
+        """Test that ripgrep is stopped and reaped when the rename itself fails"""
+        old_path = os.path.join(self.test_dir, "01a Test Note.md")
+        new_path = os.path.join(self.test_dir, "missing folder", "01b Test Note.md")
+
+        started = []
+        popen = subprocess.Popen
+        def spawn(*args, **kwargs):
+            started.append(popen(*args, **kwargs))
+            return started[-1]
+
+        with mock.patch.object(subprocess, "Popen", spawn):
+            success, updated_files = rename_and_update_links(
+                self.test_dir, old_path, new_path, "01a", "Test Note", "01b", "Test Note"
+            )
+
+        self.assertFalse(success)
+        self.assertEqual(updated_files, [])
+        self.assertTrue(os.path.exists(old_path))
+        self.assertEqual(len(started), 1)
+        self.assertIsNotNone(started[0].returncode)
+        self.assertTrue(started[0].stdout.closed)
+
 if __name__ == '__main__':
     unittest.main()
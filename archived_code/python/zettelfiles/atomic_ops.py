@@ -1,11 +1,124 @@
 import os
+import errno
 import shutil
+import secrets
 import threading
 import logging
-from typing import List, Tuple, Optional, Callable
+from typing import List, Tuple, Optional, Callable, Union
 from contextlib import contextmanager
 from pathlib import Path
 
+def move_path(old_path: str, new_path: str) -> None:
+    """
+    Move a file with a single rename, falling back to shutil.move only
+    when source and target live on different filesystems
+    """
+    try:
+        os.rename(old_path, new_path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(old_path, new_path)
+
+@contextmanager
+def atomic_writer(path: str, binary: bool = False, **open_kwargs):
+    """
+    Open a temporary file in path's directory for writing (text as UTF-8, or
+    binary) and, once the block exits cleanly, os.replace it into place so
+    readers never see a partial file. Extra arguments go to open(), e.g.
+    newline or buffering.
+
+    A symlink is followed, so its target is replaced and the link stays. A
+    file with other hard links, or whose owner the temporary file can't be
+    given, is instead overwritten in place from the finished temporary file:
+    replacing it would split it from its other names or change its owner.
+    """
+    path = os.path.realpath(path)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        st = None
+    tmp_path, fd = _create_temp(path)
+    try:
+        with os.fdopen(fd, 'wb' if binary else 'w', encoding=None if binary else 'utf-8',
+                       **open_kwargs) as tmp:
+            yield tmp
+        if st is not None:
+            if st.st_nlink > 1 or not _copy_owner(st, tmp_path):
+                shutil.copyfile(tmp_path, path)
+                os.remove(tmp_path)
+                return
+            shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _create_temp(path: str) -> Tuple[str, int]:
+    """
+    Create a new temporary file next to path, returning its path and an open
+    descriptor. It is created as 0666 so the process umask applies, giving
+    new files the usual permissions (tempfile would create it as 0600).
+    """
+    directory, name = os.path.split(path)
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+    while True:
+        tmp_path = os.path.join(directory, f".{name}.{secrets.token_hex(4)}.tmp")
+        try:
+            return tmp_path, os.open(tmp_path, flags, 0o666)
+        except FileExistsError:
+            continue
+
+def _copy_owner(st: os.stat_result, tmp_path: str) -> bool:
+    """Give the temporary file the owner and group in st; False if that isn't allowed"""
+    tmp_st = os.stat(tmp_path)
+    if (tmp_st.st_uid, tmp_st.st_gid) == (st.st_uid, st.st_gid):
+        return True
+    try:
+        os.chown(tmp_path, st.st_uid, st.st_gid)
+    except (PermissionError, AttributeError):  # No os.chown on Windows
+        return False
+    return True
+
+def atomic_write(path: str, content: Union[str, bytes]) -> None:
+    """
+    Write content (text as UTF-8, or raw bytes) to path through a temporary file
+    in the same directory, then os.replace it into place so readers never see a
+    partial file
+    """
+    with atomic_writer(path, binary=isinstance(content, bytes)) as f:
+        f.write(content)
+
+class Transaction:
+    """Undo log for a multi-step change; undos run newest first on rollback"""
+    def __init__(self):
+        self._undo: List[Callable[[], None]] = []
+
+    def push_undo(self, undo: Callable[[], None]) -> None:
+        self._undo.append(undo)
+
+    def rollback(self) -> None:
+        while self._undo:
+            undo = self._undo.pop()
+            try:
+                undo()
+            except Exception as e:
+                logging.error(f"Error during rollback: {e}")
+
+@contextmanager
+def transaction():
+    """
+    Collect undo steps for a sequence of mutations and run them in reverse
+    if the block raises, so a failure only costs what was already done
+    """
+    tx = Transaction()
+    try:
+        yield tx
+    except BaseException:
+        tx.rollback()
+        raise
+
 class AtomicFileOps:
     def __init__(self):
         self._file_locks = {}
@@ -30,6 +143,10 @@ class AtomicFileOps:
                 if filepath in self._file_locks and not lock.locked():
                     del self._file_locks[filepath]
 
+    def transaction(self):
+        """See the module-level transaction()"""
+        return transaction()
+
     def atomic_move(
         self,
         source_paths: List[str],
@@ -60,23 +177,24 @@ class AtomicFileOps:
             # Perform the move operation
             try:
                 os.makedirs(target_dir, exist_ok=True)
-                
-                # Move each file
-                for source_path in sorted_paths:
-                    target_path = os.path.join(target_dir, os.path.basename(source_path))
-                    shutil.move(source_path, target_path)
-                    affected_files.append(target_path)
-                
-                # Perform any additional updates
-                if update_func:
-                    update_func(affected_files)
-                
+
+                with self.transaction() as tx:
+                    # Move each file
+                    for source_path in sorted_paths:
+                        target_path = os.path.join(target_dir, os.path.basename(source_path))
+                        move_path(source_path, target_path)
+                        tx.push_undo(lambda src=source_path, dst=target_path: move_path(dst, src))
+                        affected_files.append(target_path)
+
+                    # Perform any additional updates
+                    if update_func:
+                        update_func(affected_files)
+
                 return True, affected_files
-                
+
             except Exception as e:
+                # The transaction has already moved everything back
                 logging.error(f"Error in atomic move: {e}")
-                # Attempt to rollback moves
-                self._rollback_moves(affected_files, sorted_paths)
                 return False, []
                 
         finally:
@@ -144,8 +262,7 @@ class AtomicFileOps:
                 os.makedirs(os.path.dirname(path), exist_ok=True)
                 
                 # Create file
-                with open(path, 'w', encoding='utf-8') as f:
-                    f.write(content)
+                atomic_write(path, content)
                 
                 # Perform any additional updates
                 if update_func:
@@ -162,12 +279,3 @@ class AtomicFileOps:
                     except Exception as rollback_error:
                         logging.error(f"Error during rollback: {rollback_error}")
                 return False
-
-    def _rollback_moves(self, moved_files: List[str], original_paths: List[str]):
-        """Attempt to rollback moved files to their original locations"""
-        for new_path, old_path in zip(moved_files, original_paths):
-            if os.path.exists(new_path):
-                try:
-                    shutil.move(new_path, old_path)
-                except Exception as e:
-                    logging.error(f"Error during move rollback: {e}")
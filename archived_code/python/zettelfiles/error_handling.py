@@ -16,6 +16,10 @@ class GraphOperationError(ZettelError):
     """Raised when a graph operation fails"""
     pass
 
+class InconsistentGraph(GraphOperationError):
+    """Raised when an in-memory graph patch doesn't match the graph; callers should rebuild"""
+    pass
+
 def setup_logging():
     """Configure logging for the application"""
     logging.basicConfig(
@@ -36,9 +40,14 @@ def handle_error(logger: logging.Logger, error: Exception, operation: str) -> Di
     error_details = {
         "type": type(error).__name__,
         "message": str(error),
-        "operation": operation,
-        "traceback": traceback.format_exc()
+        "operation": operation
     }
+    # Formatting the stack is the expensive part and only useful when debugging;
+    # exc_info below already gives log handlers the live traceback
+    if logger.isEnabledFor(logging.DEBUG):
+        error_details["traceback"] = "".join(
+            traceback.format_exception(type(error), error, error.__traceback__)
+        )
     
     if isinstance(error, ZettelError):
         error_details.update(error.details)
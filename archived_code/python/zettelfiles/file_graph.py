@@ -1,79 +1,740 @@
 import os
 import logging
-from collections import defaultdict
-from typing import Dict, Set
+import bisect
+import itertools
+import warnings
+from array import array
+from collections.abc import Mapping, MutableMapping, Set as AbstractSet, KeysView
+from dataclasses import dataclass, field
+from json.encoder import encode_basestring as _json_str
+from typing import Callable, Collection, Dict, List, Optional, Set, Tuple
 from watchdog.events import FileSystemEvent
-from .get_hierarchy import build_combined_graph, GraphNode
+from .get_hierarchy import build_combined_graph, get_file_creation_time, SUPPORTED_EXTENSIONS
+from .utils import get_parent_id, split_node_name
+from .error_handling import InconsistentGraph
+
+# Shared counter so a graph's version never repeats, even across rebuilds
+_versions = itertools.count()
+
+@dataclass
+class GraphPatch:
+    """Describes a filesystem mutation so the graph can be patched in memory instead of rescanned"""
+    created: List[str] = field(default_factory=list)  # absolute paths of new files
+    deleted: List[str] = field(default_factory=list)  # stable IDs of removed nodes
+    moved: List[Tuple[str, str, str]] = field(default_factory=list)  # (stable_id, new_path, new_folgezettel_id)
+    renamed: List[Tuple[str, str]] = field(default_factory=list)  # (stable_id, new_name)
+    rewritten: List[str] = field(default_factory=list)  # absolute paths of files whose text changed
+
+    def __bool__(self) -> bool:
+        return bool(self.created or self.deleted or self.moved or self.renamed or self.rewritten)
+
+class _Column(MutableMapping):
+    """dict-style view of one FileGraph column, keyed by stable ID"""
+    def __init__(
+        self,
+        graph: 'FileGraph',
+        column: List[str],
+        skip_empty: bool = False,
+        setter: Optional[Callable[[int, str], None]] = None
+    ):
+        self._graph = graph
+        self._column = column
+        self._skip_empty = skip_empty  # hide nodes whose value is "" (e.g. no Folgezettel ID)
+        self._setter = setter  # writes through the graph when it keeps an index on the column
+
+    def __getitem__(self, stable_id: str) -> str:
+        value = self._column[self._graph._id_to_idx[stable_id]]
+        if self._skip_empty and not value:
+            raise KeyError(stable_id)
+        return value
+
+    def __setitem__(self, stable_id: str, value: str):
+        graph = self._graph
+        i = graph._id_to_idx[stable_id]
+        graph._unindex_file(i)
+        if self._setter is not None:
+            self._setter(i, value)
+        else:
+            self._column[i] = value
+        graph._index_file(i)
+        # Memoized paths are built from the columns
+        graph.mark_changed()
+
+    def __delitem__(self, stable_id: str):
+        if not self._skip_empty:
+            raise TypeError("Column values can only be removed together with their node")
+        self[stable_id]  # KeyError if unset
+        self.__setitem__(stable_id, "")
+
+    def __iter__(self):
+        column = self._column
+        for stable_id, i in self._graph._id_to_idx.items():
+            if not self._skip_empty or column[i]:
+                yield stable_id
+
+    def __len__(self) -> int:
+        if not self._skip_empty:
+            return len(self._graph._id_to_idx)
+        return sum(1 for _ in self)
+
+class _Flags(AbstractSet):
+    """Set-style view of the nodes whose flag is set in a FileGraph column"""
+    def __init__(self, graph: 'FileGraph', column: List[bool]):
+        self._graph = graph
+        self._column = column
+
+    def __contains__(self, stable_id) -> bool:
+        i = self._graph._id_to_idx.get(stable_id)
+        return i is not None and self._column[i]
+
+    def __iter__(self):
+        column = self._column
+        return (stable_id for stable_id, i in self._graph._id_to_idx.items() if column[i])
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+class _FolgezettelIndex(Mapping):
+    """Read-only map from Folgezettel ID to the stable ID of the first node that has it"""
+    def __init__(self, graph: 'FileGraph'):
+        self._graph = graph
+
+    def __getitem__(self, folgezettel_id: str) -> str:
+        graph = self._graph
+        return graph._ids[graph._fz_rows[folgezettel_id][0]]
+
+    def __iter__(self):
+        return iter(self._graph._fz_rows)
+
+    def __len__(self) -> int:
+        return len(self._graph._fz_rows)
+
+class _Edges(Mapping):
+    """dict-style view of FileGraph's edges: parent stable ID -> its children"""
+    def __init__(self, graph: 'FileGraph'):
+        self._graph = graph
+
+    def __getitem__(self, parent: str) -> Collection[str]:
+        children = self._graph._children(parent)
+        if not children:
+            raise KeyError(parent)
+        return children
+
+    def __iter__(self):
+        graph = self._graph
+        patches = graph._edge_patches
+        indptr = graph._indptr
+        for i in range(len(indptr) - 1):
+            stable_id = graph._ids[i]
+            if indptr[i] != indptr[i + 1] and stable_id is not None and stable_id not in patches:
+                yield stable_id
+        for stable_id, children in patches.items():
+            if children:
+                yield stable_id
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
 
 class FileGraph:
+    # Only these watchdog event types can change the graph. opened/closed/closed_no_write
+    # fire on every read of a note (editors, indexers, our own rg scans), and a watch set
+    # up for those floods the queue without ever changing a node.
+    interesting_event_types = frozenset({"moved", "created", "deleted", "modified"})
+
     def __init__(self):
-        self.surrogate_nodes = set()
-        self.edges: Dict[str, Set[str]] = defaultdict(set)
-        self.all_nodes: Set[str] = set()
-        self.folgezettel_ids: Dict[str, str] = {}  # stable_id -> folgezettel_id
-        self.names: Dict[str, str] = {}  # stable_id -> name
-        self.paths: Dict[str, str] = {}  # stable_id -> path
-        self.extensions: Dict[str, str] = {}  # stable_id -> extension
-        self.folder_nodes: Set[str] = set()  # stable_ids of directory nodes
-
-    def build_from_directory(self, directory: str):
-        """Build graph from directory structure using get_hierarchy implementation"""
+        self.base_dir: Optional[str] = None
+        self.parents: Dict[str, str] = {}  # child stable_id -> parent stable_id
+
+        # Node data is stored column-wise: each stable_id is interned to a row
+        # index, and every attribute lives in its own list indexed by that row
+        self._id_to_idx: Dict[str, int] = {}  # stable_id -> row, in insertion order
+        self._ids: List[Optional[str]] = []  # row -> stable_id (None once removed)
+        self._fz: List[str] = []  # row -> folgezettel_id ("" if none)
+        self._names: List[str] = []  # row -> name
+        self._paths: List[str] = []  # row -> directory path
+        self._exts: List[str] = []  # row -> extension
+        self._is_dir: List[bool] = []  # row -> directory node?
+        self._is_surrogate: List[bool] = []  # row -> surrogate node?
+        self.dir_path_to_id: Dict[str, str] = {}  # directory path -> stable_id of its node
+        # Rows holding each Folgezettel ID, ascending; the first is the ID's node, as
+        # in build_combined_graph (duplicates are possible, e.g. "01 Math" folder and note)
+        self._fz_rows: Dict[str, List[int]] = {}
+        # (directory path, Folgezettel ID, name, extension) -> row of each file node,
+        # so watcher events find their node without scanning the columns
+        self._file_rows: Dict[Tuple[str, str, str, str], int] = {}
+
+        # Mapping/set views over the columns for callers that want dict semantics
+        self.folgezettel_ids = _Column(self, self._fz, skip_empty=True, setter=self._set_folgezettel)  # stable_id -> folgezettel_id
+        self.names = _Column(self, self._names)  # stable_id -> name
+        self.paths = _Column(self, self._paths)  # stable_id -> path
+        self.extensions = _Column(self, self._exts)  # stable_id -> extension
+        self.folder_nodes = _Flags(self, self._is_dir)  # stable_ids of directory nodes
+        self.surrogate_nodes = _Flags(self, self._is_surrogate)
+        self.folgezettel_to_stable = _FolgezettelIndex(self)  # folgezettel_id -> stable_id
+
+        # Edges are frozen after a build into CSR form over row indices: the children of
+        # row i are _indices[_indptr[i]:_indptr[i + 1]]. Parents edited since then keep
+        # their full child set in _edge_patches, which takes precedence over the arrays.
+        self._indptr = array('i', [0])
+        self._indices = array('i')
+        self._edge_patches: Dict[str, Set[str]] = {}
+        self.edges = _Edges(self)  # parent stable_id -> child stable_ids
+
+        self._version: int = next(_versions)  # changes on every mutation
+        self._rel_paths: Dict[str, str] = {}  # stable_id -> relative file path, valid for _version
+
+    @property
+    def all_nodes(self) -> KeysView:
+        """Insertion-ordered, set-like view of every stable_id in the graph"""
+        return self._id_to_idx.keys()
+
+    def add_node(
+        self,
+        stable_id: str,
+        folgezettel_id: str = "",
+        name: str = "",
+        path: str = "",
+        extension: str = "",
+        is_directory: bool = False,
+        is_surrogate: bool = False
+    ) -> int:
+        """Append a node row and return its index"""
+        if stable_id in self._id_to_idx:
+            raise ValueError(f"Node already exists: {stable_id}")
+        i = len(self._ids)
+        self._id_to_idx[stable_id] = i
+        self._ids.append(stable_id)
+        self._fz.append(folgezettel_id)
+        if folgezettel_id:
+            self._fz_rows.setdefault(folgezettel_id, []).append(i)
+        self._names.append(name)
+        self._paths.append(path)
+        self._exts.append(extension)
+        self._is_dir.append(is_directory)
+        self._is_surrogate.append(is_surrogate)
+        if is_directory:
+            self.dir_path_to_id[path] = stable_id
+        self._index_file(i)
+        return i
+
+    def _file_key(self, i: int) -> Tuple[str, str, str, str]:
+        return (self._paths[i], self._fz[i], self._names[i], self._exts[i])
+
+    def _index_file(self, i: int):
+        """Add a row to the file lookup, if it is a live file node"""
+        if self._ids[i] is not None and not self._is_dir[i] and not self._is_surrogate[i]:
+            self._file_rows[self._file_key(i)] = i
+
+    def _unindex_file(self, i: int):
+        """Drop a row from the file lookup before its path, name, ID or extension changes"""
+        key = self._file_key(i)
+        if self._file_rows.get(key) == i:
+            del self._file_rows[key]
+
+    def build_from_directory(self, directory: str, use_cache: bool = False):
+        """
+        Build graph from directory structure using get_hierarchy implementation
+        (use_cache: reuse unchanged directory listings, see build_combined_graph)
+        """
         self.__init__()  # Reset the graph
+        self.base_dir = directory
 
         # Get combined graph from get_hierarchy
-        combined_graph = build_combined_graph(directory)
+        combined_graph = build_combined_graph(directory, use_cache=use_cache)
 
         # Convert the combined graph format to our internal format
         for stable_id, node_data in combined_graph["nodes"].items():
-            self.all_nodes.add(stable_id)
-            if node_data["id"]:  # Store Folgezettel ID if present
-                self.folgezettel_ids[stable_id] = node_data["id"]
-            self.names[stable_id] = node_data["name"]
-            self.paths[stable_id] = node_data["path"]
-            self.extensions[stable_id] = node_data["extension"]
+            self.add_node(
+                stable_id,
+                node_data["id"],
+                node_data["name"],
+                node_data["path"],
+                node_data["extension"],
+                is_directory=node_data.get("is_directory", False),
+                is_surrogate=stable_id.startswith("surrogate_")
+            )
 
-            # Mark surrogate nodes
-            if stable_id.startswith("surrogate_"):
-                self.surrogate_nodes.add(stable_id)
+        # Convert edges (already using stable IDs)
+        self._freeze_edges(combined_graph["edges"])
 
-            # Mark folder nodes
-            if node_data.get("is_directory", False):
-                self.folder_nodes.add(stable_id)
+    def _freeze_edges(self, edges: Dict[str, Set[str]]):
+        """Flatten a parent -> children dict into the CSR arrays, dropping any overlay"""
+        id_to_idx = self._id_to_idx
+        indptr = array('i', [0])
+        indices = array('i')
+        parents = {}
+        for parent in self._ids:
+            children = edges.get(parent) if parent is not None else None
+            if children:
+                for child in sorted(children):
+                    indices.append(id_to_idx[child])
+                    parents[child] = parent
+            indptr.append(len(indices))
+        self._indptr = indptr
+        self._indices = indices
+        self._edge_patches = {}
+        self.parents = parents
 
-        # Convert edges (already using stable IDs)
-        self.edges = combined_graph["edges"]
+    def _children(self, parent: str) -> Collection[str]:
+        """Children of parent; empty if it has none or isn't in the graph"""
+        patched = self._edge_patches.get(parent)
+        if patched is not None:
+            return patched
+        i = self._id_to_idx.get(parent)
+        indptr = self._indptr
+        if i is None or i + 1 >= len(indptr):
+            return ()
+        ids = self._ids
+        return tuple(ids[j] for j in self._indices[indptr[i]:indptr[i + 1]])
+
+    def _patched_children(self, parent: str) -> Set[str]:
+        """Mutable child set for parent, copied into the overlay on first edit"""
+        children = self._edge_patches.get(parent)
+        if children is None:
+            children = self._edge_patches[parent] = set(self._children(parent))
+        return children
+
+    def remove_node(self, stable_id: str):
+        """Drop a node row and its edge to its parent"""
+        self.unlink(stable_id)
+        i = self._id_to_idx.pop(stable_id)
+        self._edge_patches.pop(stable_id, None)
+        self._unindex_file(i)
+        if self._is_dir[i] and self.dir_path_to_id.get(self._paths[i]) == stable_id:
+            del self.dir_path_to_id[self._paths[i]]
+        # Rows are tombstoned rather than compacted; the next rebuild reclaims them
+        self._ids[i] = None
+        self._set_folgezettel(i, "")
+        self._is_dir[i] = False
+        self._is_surrogate[i] = False
+
+    def link(self, parent: str, child: str):
+        """Make parent the (only) parent of child"""
+        self.unlink(child)
+        self._patched_children(parent).add(child)
+        self.parents[child] = parent
+
+    def unlink(self, child: str) -> Optional[str]:
+        """Detach child from its parent, returning the old parent if there was one"""
+        parent = self.parents.pop(child, None)
+        if parent is not None:
+            self._patched_children(parent).discard(child)
+        return parent
+
+    def _rekey(self, old_id: str, new_id: str):
+        """Give a node a new stable ID in place, keeping its row, parent and children"""
+        children = set(self._children(old_id))
+        parent = self.unlink(old_id)
+        i = self._id_to_idx.pop(old_id)
+        self._edge_patches.pop(old_id, None)
+        self._id_to_idx[new_id] = i
+        self._ids[i] = new_id
+        # Always overlay the children: the frozen CSR row would still list the old ones
+        self._edge_patches[new_id] = children
+        for child in children:
+            self.parents[child] = new_id
+        if parent is not None:
+            self.link(parent, new_id)
+
+    def _set_folgezettel(self, i: int, folgezettel_id: str):
+        """Change a row's Folgezettel ID, keeping the reverse index in step"""
+        old = self._fz[i]
+        if old == folgezettel_id:
+            return
+        if old:
+            rows = self._fz_rows[old]
+            rows.remove(i)
+            if not rows:
+                del self._fz_rows[old]
+        if folgezettel_id:
+            bisect.insort(self._fz_rows.setdefault(folgezettel_id, []), i)
+        self._fz[i] = folgezettel_id
+
+    def _find_by_folgezettel(self, folgezettel_id: str) -> Optional[str]:
+        return self.folgezettel_to_stable.get(folgezettel_id)
+
+    def _resolve_parent(self, stable_id: str) -> Optional[str]:
+        """Work out a node's parent the same way build_combined_graph does"""
+        i = self._id_to_idx[stable_id]
+
+        # ID-based parent, creating a surrogate if the parent ID has no file
+        folgezettel_id = self._fz[i]
+        if folgezettel_id:
+            parent_id = get_parent_id(folgezettel_id)
+            if parent_id:
+                parent = self._find_by_folgezettel(parent_id)
+                if parent is None:
+                    parent = f"surrogate_{parent_id}"
+                    self.add_node(parent, parent_id, f"Surrogate {parent_id}", ".", is_surrogate=True)
+                    self._relink(parent)
+                return parent
+
+        # Folder-based parent
+        if self._is_dir[i]:
+            parent_path = os.path.dirname(self._paths[i])
+        else:
+            parent_path = self._paths[i]
+        if parent_path and parent_path != ".":
+            parent = self.dir_path_to_id.get(parent_path)
+            if parent is None:
+                raise InconsistentGraph(f"No directory node for path: {parent_path}")
+            if parent != stable_id:
+                return parent
+        return None
+
+    def _relink(self, stable_id: str):
+        """Attach a node to its resolved parent, dropping surrogates left without children"""
+        parent = self._resolve_parent(stable_id)
+        if parent == self.parents.get(stable_id):
+            return
+        old_parent = self.unlink(stable_id)
+        if parent is not None:
+            self.link(parent, stable_id)
+        self.prune_surrogates(old_parent)
+
+    def prune_surrogates(self, stable_id: Optional[str]) -> List[Tuple[str, str, Optional[str]]]:
+        """
+        Remove surrogates that no longer have children, walking up the surrogate
+        chain from stable_id. Returns (stable ID, Folgezettel ID, parent) of each
+        removed surrogate, bottom-up.
+        """
+        removed = []
+        while (stable_id is not None and stable_id in self.surrogate_nodes
+               and not self.edges.get(stable_id)):
+            parent = self.parents.get(stable_id)
+            removed.append((stable_id, self._fz[self._id_to_idx[stable_id]], parent))
+            self.remove_node(stable_id)
+            stable_id = parent
+        return removed
+
+    def _add_file(self, file_path: str):
+        if self.base_dir is None:
+            raise InconsistentGraph("Graph has no base directory")
+        base_name, extension = os.path.splitext(os.path.basename(file_path))
+        if extension.lower() not in SUPPORTED_EXTENSIONS:
+            return
+
+        stable_id = get_file_creation_time(file_path)
+        path = os.path.dirname(os.path.relpath(file_path, self.base_dir))
+        folgezettel_id, name = split_node_name(base_name)
+        if stable_id in self._id_to_idx:
+            # Same file seen again (e.g. recreated in place): treat as a move/rename
+            self._move(stable_id, path, folgezettel_id)
+            self.names[stable_id] = name
+            return
+        self._check_new_id(folgezettel_id)
+        self.add_node(stable_id, folgezettel_id, name, path, extension)
+        self._relink(stable_id)
+
+    def _check_new_id(self, folgezettel_id: str):
+        if folgezettel_id and f"surrogate_{folgezettel_id}" in self._id_to_idx:
+            # A real node replaces a surrogate; leave re-parenting its children to a rebuild
+            raise InconsistentGraph(f"Folgezettel ID {folgezettel_id} is held by a surrogate")
+
+    def _move(self, stable_id: str, new_path: str, new_folgezettel_id: str):
+        i = self._id_to_idx[stable_id]
+        if self._is_dir[i] and new_path != self._paths[i]:
+            raise InconsistentGraph(f"Directory node moved: {stable_id}")
+        for child in self.edges.get(stable_id, ()):
+            # Children found through this node's ID must still extend it
+            child_parent_id = get_parent_id(self._fz[self._id_to_idx[child]])
+            if child_parent_id and child_parent_id != new_folgezettel_id:
+                raise InconsistentGraph(f"Node with children changed ID: {stable_id}")
+        self._check_new_id(new_folgezettel_id)
+        self._unindex_file(i)
+        self._set_folgezettel(i, new_folgezettel_id)
+        self._paths[i] = new_path
+        self._index_file(i)
+        self._relink(stable_id)
+
+    def apply_patch(self, patch: GraphPatch):
+        """
+        Apply a GraphPatch in place.
+
+        Raises:
+            InconsistentGraph: If the patch refers to nodes the graph doesn't have, or
+                describes a change that can't be applied locally. The graph may be
+                partially patched and should be rebuilt.
+        """
+        for stable_id in patch.deleted:
+            if stable_id not in self._id_to_idx:
+                raise InconsistentGraph(f"Deleted node not in graph: {stable_id}")
+            if self.edges.get(stable_id):
+                raise InconsistentGraph(f"Deleted node has children: {stable_id}")
+            old_parent = self.parents.get(stable_id)
+            self.remove_node(stable_id)
+            self.prune_surrogates(old_parent)
+        for file_path in patch.created:
+            self._add_file(file_path)
+        for stable_id, new_path, new_folgezettel_id in patch.moved:
+            if stable_id not in self._id_to_idx:
+                raise InconsistentGraph(f"Moved node not in graph: {stable_id}")
+            self._move(stable_id, new_path, new_folgezettel_id)
+        for stable_id, new_name in patch.renamed:
+            if stable_id not in self._id_to_idx:
+                raise InconsistentGraph(f"Renamed node not in graph: {stable_id}")
+            self.names[stable_id] = new_name
+        # Writing a file changes the timestamps its stable ID is built from
+        for file_path in patch.rewritten:
+            try:
+                self._refresh_file(file_path)
+            except FileNotFoundError:
+                raise InconsistentGraph(f"Rewritten file not found: {file_path}")
+        self.mark_changed()
+
+    def find_id_subtree(self, folgezettel_id: str) -> List[str]:
+        """Stable IDs of the node with this Folgezettel ID and of every node whose ID extends it"""
+        ids = self._ids
+        return [
+            ids[i] for i, fz in enumerate(self._fz)
+            if fz and fz.startswith(folgezettel_id)
+        ]
+
+    def mark_changed(self):
+        """Record a mutation, invalidating anything memoized for the previous version"""
+        self._version = next(_versions)
+        self._rel_paths.clear()
+
+    def rel_path(self, stable_id: str) -> str:
+        """Path of a node's file relative to the base directory, memoized until the next mutation"""
+        rel_path = self._rel_paths.get(stable_id)
+        if rel_path is None:
+            i = self._id_to_idx.get(stable_id)
+            if i is None:
+                raise ValueError(f"Node not found: {stable_id}")
+
+            # Construct filename based on whether node has a Folgezettel ID
+            folgezettel_id = self._fz[i]
+            if folgezettel_id:
+                filename = f"{folgezettel_id} {self._names[i]}{self._exts[i]}"
+            else:
+                filename = f"{self._names[i]}{self._exts[i]}"
+
+            rel_path = os.path.join(self._paths[i] or "", filename)
+            self._rel_paths[stable_id] = rel_path
+        return rel_path
+
+    def find_file(self, file_path: str) -> Optional[str]:
+        """Stable ID of the file node at an absolute path, if the graph has one"""
+        if self.base_dir is None:
+            raise InconsistentGraph("Graph has no base directory")
+        rel_path = os.path.relpath(file_path, self.base_dir)
+        path = os.path.dirname(rel_path)
+        base_name, extension = os.path.splitext(os.path.basename(rel_path))
+        folgezettel_id, name = split_node_name(base_name)
+        i = self._file_rows.get((path, folgezettel_id, name, extension))
+        return None if i is None else self._ids[i]
 
     def update_from_change(self, event: FileSystemEvent):
-        # Handle file system changes
-        pass
+        """
+        Patch the graph in place for one watcher event.
+
+        Raises:
+            InconsistentGraph: If the event can't be applied locally (directory
+                changes, files in directories the graph doesn't know, ...). The
+                graph should be rebuilt.
+        """
+        if event.event_type not in self.interesting_event_types:
+            return
+        if event.is_directory:
+            if event.event_type == "modified":
+                return  # Fires for every entry added or removed; the file events cover it
+            raise InconsistentGraph(f"Directory {event.event_type}: {event.src_path}")
+
+        try:
+            if event.event_type == "deleted":
+                stable_id = self.find_file(event.src_path)
+                if stable_id is not None:
+                    self.apply_patch(GraphPatch(deleted=[stable_id]))
+            elif event.event_type in ("created", "modified"):
+                self._refresh_file(event.src_path)
+            else:
+                self._move_file(event.src_path, event.dest_path)
+        except FileNotFoundError:
+            # Already gone again (editor temp files); its deletion event follows
+            pass
+
+    def _refresh_file(self, file_path: str):
+        """
+        Add a file the graph doesn't have, or follow the stable ID of one it does:
+        writes (and replace-by-rename saves) change the mtime the ID is built from
+        """
+        new_id = get_file_creation_time(file_path)
+        old_id = self.find_file(file_path)
+        if old_id is None:
+            self.apply_patch(GraphPatch(created=[file_path]))
+        elif old_id != new_id:
+            if new_id in self._id_to_idx:
+                raise InconsistentGraph(f"Stable ID {new_id} already taken")
+            self._rekey(old_id, new_id)
+            self.mark_changed()
+
+    def _move_file(self, src_path: str, dest_path: str):
+        stable_id = self.find_file(src_path)
+        if stable_id is None:
+            # Not ours (e.g. an editor's temp file saved over a note), or already
+            # patched by FileManager: look at what is at the destination now
+            self._refresh_file(dest_path)
+            return
+        rel_path = os.path.relpath(dest_path, self.base_dir)
+        base_name, extension = os.path.splitext(os.path.basename(rel_path))
+        if extension.lower() not in SUPPORTED_EXTENSIONS:
+            self.apply_patch(GraphPatch(deleted=[stable_id]))
+            return
+        new_id = get_file_creation_time(dest_path)
+        if new_id != stable_id and new_id not in self._id_to_idx:
+            self._rekey(stable_id, new_id)
+            stable_id = new_id
+        folgezettel_id, name = split_node_name(base_name)
+        self.extensions[stable_id] = extension
+        self.apply_patch(GraphPatch(
+            moved=[(stable_id, os.path.dirname(rel_path), folgezettel_id)],
+            renamed=[(stable_id, name)]
+        ))
 
     def to_dict(self):
-        """Convert graph to dictionary format for API/testing"""
+        """Convert graph to dictionary format for internal use (nodes in build order, unsorted)"""
+        return {
+            "nodes": {stable_id: self._row_props(i) for stable_id, i in self._id_to_idx.items()},
+            "edges": {k: list(v) for k, v in self.edges.items()},
+            "id_nodes": list(self.folgezettel_ids.keys()),
+            "folder_nodes": list(self.folder_nodes)
+        }
+
+    def to_dict_sorted(self):
+        """Convert graph to dictionary format with stable ordering for API/testing"""
         return {
             "nodes": {
-                stable_id: {
-                    "id": self.folgezettel_ids.get(stable_id, ""),
-                    "name": self.names.get(stable_id, ""),
-                    "path": self.paths.get(stable_id, ""),
-                    "extension": self.extensions.get(stable_id, ""),
-                    "is_directory": stable_id in self.folder_nodes
-                }
-                for stable_id in sorted(self.all_nodes)
+                stable_id: self._row_props(self._id_to_idx[stable_id])
+                for stable_id in sorted(self._id_to_idx)
             },
-            "edges": {k: sorted(list(v)) for k, v in self.edges.items()},  # Convert set to sorted list
-            "id_nodes": list(self.folgezettel_ids.keys()),  # Convert set to list 
+            "edges": {k: sorted(v) for k, v in self.edges.items()},  # Convert set to sorted list
+            "id_nodes": list(self.folgezettel_ids.keys()),  # Convert set to list
             "folder_nodes": list(self.folder_nodes)  # Convert set to list
         }
-    def node_props(self, stable_id):
+
+    def iter_json_sorted(self):
+        """
+        Yield to_dict_sorted() as JSON text in chunks, written straight from the
+        columns instead of through a dict per node
+        """
+        return self._iter_json(sorted(self._id_to_idx), self.edges.items(), self.all_nodes)
+
+    def to_json_sorted(self) -> str:
+        """to_dict_sorted() serialized to JSON"""
+        return ''.join(self.iter_json_sorted())
+
+    def to_json_view(self, subtree: str = ".", max_depth: Optional[int] = None) -> str:
+        """
+        The part of the graph in the folder at subtree (a folder node's 'path')
+        as JSON in the to_json_sorted format, with max_depth levels of subfolders
+        (0 lists just the folder, None everything below it). Folders at the
+        depth limit come without their contents and, if they have any, marked
+        "has_children": true, to be fetched with a view of their own.
+
+        Nodes keep their stable IDs and edges from the full graph, so views can
+        be merged: the parent of every node in the view is included with it,
+        even if it lives elsewhere (e.g. the note of a Folgezettel parent).
+
+        Raises:
+            ValueError: If subtree is outside the base directory
+        """
+        subtree = os.path.normpath(subtree)
+        if os.path.isabs(subtree) or subtree == os.pardir or subtree.startswith(os.pardir + os.sep):
+            raise ValueError(f"Subtree is outside the base directory: {subtree}")
+        prefix = "" if subtree == "." else subtree + os.sep
+        paths, is_dir = self._paths, self._is_dir
+
+        in_view: List[str] = []
+        stubs: Dict[str, bool] = {}  # folder path at the depth limit -> has contents
+        for stable_id, i in self._id_to_idx.items():
+            path = paths[i]
+            if path in ("", "."):
+                rel = "" if subtree == "." else None  # top-level files, surrogates, the root folder
+            elif path == subtree:
+                rel = ""
+            elif path.startswith(prefix):
+                rel = path[len(prefix):]
+            else:
+                rel = None
+            if rel is None:
+                continue
+            # Folder levels below subtree holding this node (a folder node's
+            # path is the folder itself, which sits one level up)
+            level = rel.count(os.sep) + 1 if rel else 0
+            if is_dir[i] and level:
+                level -= 1
+            if max_depth is None or level <= max_depth:
+                in_view.append(stable_id)
+                if is_dir[i] and level == max_depth and rel:
+                    stubs.setdefault(path, False)
+            else:
+                # Below the limit: only marks its folder at the limit as non-empty
+                stubs[prefix + os.sep.join(rel.split(os.sep)[:max_depth + 1])] = True
+
+        parents = self.parents
+        nodes = set(in_view)
+        edges: Dict[str, List[str]] = {}
+        for stable_id in in_view:
+            parent = parents.get(stable_id)
+            if parent is not None:
+                nodes.add(parent)
+                edges.setdefault(parent, []).append(stable_id)
+        has_children = {self.dir_path_to_id[path] for path, full in stubs.items() if full}
+        listed = [stable_id for stable_id in self._id_to_idx if stable_id in nodes]
+        return ''.join(self._iter_json(sorted(nodes), edges.items(), listed, has_children))
+
+    def _iter_json(self, stable_ids, edges, listed, has_children=frozenset()):
+        """
+        Yield JSON text for the nodes stable_ids (in that order), the parent ->
+        children pairs edges, and the ID/folder lists over the nodes in listed;
+        nodes in has_children get "has_children": true
+        """
+        id_to_idx = self._id_to_idx
+        fz, names, paths, exts, is_dir = self._fz, self._names, self._paths, self._exts, self._is_dir
+        yield '{"nodes":{'
+        sep = ''
+        for stable_id in stable_ids:
+            i = id_to_idx[stable_id]
+            stub = ',"has_children":true' if stable_id in has_children else ''
+            yield (
+                f'{sep}{_json_str(stable_id)}:{{"id":{_json_str(fz[i])},"name":{_json_str(names[i])},'
+                f'"path":{_json_str(paths[i])},"extension":{_json_str(exts[i])},'
+                f'"is_directory":{"true" if is_dir[i] else "false"}{stub}}}'
+            )
+            sep = ','
+        yield '},"edges":{'
+        yield ','.join(
+            f'{_json_str(parent)}:[{",".join(map(_json_str, sorted(children)))}]'
+            for parent, children in edges
+        )
+        yield '},"id_nodes":['
+        yield ','.join(_json_str(stable_id) for stable_id in listed if fz[id_to_idx[stable_id]])
+        yield '],"folder_nodes":['
+        yield ','.join(_json_str(stable_id) for stable_id in listed if is_dir[id_to_idx[stable_id]])
+        yield ']}'
+
+    def _row_props(self, i: int) -> dict:
         return {
-            "id": self.folgezettel_ids.get(stable_id, ""),
-            "name": self.names.get(stable_id, ""),
-            "path": self.paths.get(stable_id, ""),
-            "extension": self.extensions.get(stable_id, ""),
-            "is_directory": stable_id in self.folder_nodes
+            "id": self._fz[i],
+            "name": self._names[i],
+            "path": self._paths[i],
+            "extension": self._exts[i],
+            "is_directory": self._is_dir[i]
         }
 
+    def node_props(self, stable_id):
+        i = self._id_to_idx.get(stable_id)
+        if i is None:
+            return {"id": "", "name": "", "path": "", "extension": "", "is_directory": False}
+        return self._row_props(i)
+
     @property
     def nodes(self):
         """Property for backward compatibility with tests"""
-        return self.to_dict()["nodes"]
+        warnings.warn(
+            "FileGraph.nodes builds a dict of every node; use all_nodes, node_props or the column views",
+            DeprecationWarning,
+            stacklevel=2
+        )
+        return {stable_id: self._row_props(i) for stable_id, i in self._id_to_idx.items()}
@@ -1,13 +1,17 @@
 from typing import List, Tuple, Optional
 from .file_operations import move_files, get_file_path, create_file
-from .zettelrename import rename_and_update_links, find_links_to_file
+from .file_graph import GraphPatch
+from .zettelrename import rename_and_update_links
 from .graph_manager import GraphManager
 from .atomic_ops import AtomicFileOps
 from .get_hierarchy import get_file_creation_time
+from .utils import split_node_name
 import os
 import logging
 from tkinter.constants import TOP
 
+logger = logging.getLogger(__name__)
+
 class FileManager:
     def __init__(self, graph_manager: GraphManager):
         self.graph_manager = graph_manager
@@ -19,16 +23,14 @@ class FileManager:
         target_stable_id: str
     ) -> Tuple[bool, List[str]]:
         """Move files and update graph using stable IDs"""
-        print(f"FileManager.move_files called with sources={source_stable_ids}, target={target_stable_id}")
+        logger.debug("FileManager.move_files sources=%s target=%s", source_stable_ids, target_stable_id)
         if not self.graph_manager.base_dir:
             raise ValueError("No base directory set")
 
         try:
-            print(f"Using base_dir: {self.graph_manager.base_dir}")
-            print(f"Current graph state: {self.graph_manager.graph}")
-
-            # Update graph before any operations
-            self.graph_manager.update_graph()
+            logger.debug("Using base_dir: %s", self.graph_manager.base_dir)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Current graph state: %s", self.graph_manager.graph.to_dict())
 
             # Convert paths to stable IDs
             if not isinstance(source_stable_ids, List):
@@ -41,63 +43,55 @@ class FileManager:
                     rel_path = os.path.relpath(source_id, self.graph_manager.base_dir)
                     # Get file creation time as stable ID
                     source_stable_id = get_file_creation_time(source_id)
-                    if source_stable_id not in self.graph_manager.graph.nodes:
+                    if source_stable_id not in self.graph_manager.graph.all_nodes:
                         # Try updating the graph again
                         self.graph_manager.update_graph()
-                        if source_stable_id not in self.graph_manager.graph.nodes:
+                        if source_stable_id not in self.graph_manager.graph.all_nodes:
                             raise ValueError(f"Source file not found in graph: {rel_path}")
                     converted_source_ids.append(source_stable_id)
                 else:
                     # Check if the ID exists in the graph
-                    if source_id not in self.graph_manager.graph.nodes:
+                    if source_id not in self.graph_manager.graph.all_nodes:
                         raise ValueError(f"Source ID not found in graph: {source_id}")
                     converted_source_ids.append(source_id)
 
             # Convert target path to stable ID
             if os.path.exists(target_stable_id):
                 rel_path = os.path.relpath(target_stable_id, self.graph_manager.base_dir)
-                target_id = next(
-                    (k for k, n in self.graph_manager.graph.nodes.items()
-                     if n.get('is_directory', False) and n.get('path', '') == rel_path),
-                    None
-                )
+                target_id = self.graph_manager.graph.dir_path_to_id.get(rel_path)
                 if not target_id:
                     # If target directory doesn't exist in graph, update the graph
                     self.graph_manager.update_graph()
                     # Try finding the directory again
-                    target_id = next(
-                        (k for k, n in self.graph_manager.graph.nodes.items()
-                         if n.get('is_directory', False) and n.get('path', '') == rel_path),
-                        None
-                    )
+                    target_id = self.graph_manager.graph.dir_path_to_id.get(rel_path)
                     if not target_id:
                         return False, []  # Target directory not found
                 target_stable_id = target_id
             else:
                 # Check if the target ID exists in the graph
-                if target_stable_id not in self.graph_manager.graph.nodes:
+                if target_stable_id not in self.graph_manager.graph.all_nodes:
                     return False, []  # Target ID not found
             
             # Use new move_files implementation
-            success, updated_files, updated_graph = move_files(
+            success, updated_files, updated_graph, patch = move_files(
                 self.graph_manager.base_dir,
                 converted_source_ids,
                 target_stable_id,
                 self.graph_manager.graph
             )
 
-            print(f"move_files result: success={success}, updated_files={updated_files}")
+            logger.debug("move_files result: success=%s updated_files=%s", success, updated_files)
 
-            if success:
-                # Update the graph manager with new graph state
-                self.graph_manager.graph = updated_graph
-                # Trigger graph update to ensure consistency
-                self.graph_manager.update_graph()
+            # Update the graph manager with new graph state; the patch covers
+            # whatever was moved, even if a later source failed
+            self.graph_manager.graph = updated_graph
+            if patch:
+                self.graph_manager.apply_patch(patch)
 
             return success, updated_files
 
         except Exception as e:
-            logging.error("Error during move operation: %s", e)
+            logger.error("Error during move operation: %s", e)
             if isinstance(e, ValueError):
                 raise
             return False, []
@@ -119,7 +113,8 @@ class FileManager:
             new_name = os.path.splitext(os.path.basename(new_path))[0]
             old_parts = old_name.split(' ', 1)
             new_parts = new_name.split(' ', 1)
-            print(f"Renaming file with stuff: {old_name, new_name, old_parts, new_parts}")
+            logger.debug("Renaming %s -> %s (parts %s -> %s)", old_name, new_name, old_parts, new_parts)
+            stable_id = self.graph_manager.graph.find_file(old_path)
             success, updated_files = rename_and_update_links(
                 self.graph_manager.base_dir,
                 old_path,
@@ -131,11 +126,23 @@ class FileManager:
             )
 
             if success:
-                self.graph_manager.update_graph()
+                if stable_id is None:
+                    # Not a file the graph knows about
+                    self.graph_manager.update_graph()
+                    return success, updated_files
+                new_id, new_base_name = split_node_name(new_name)
+                new_dir = os.path.relpath(os.path.dirname(new_path), self.graph_manager.base_dir)
+                # The renamed note and the notes whose links were rewritten are
+                # re-keyed by their new timestamps
+                self.graph_manager.apply_patch(GraphPatch(
+                    moved=[(stable_id, "" if new_dir == "." else new_dir, new_id)],
+                    renamed=[(stable_id, new_base_name)],
+                    rewritten=[new_path, *updated_files]
+                ))
 
             return success, updated_files
         except Exception as e:
-            logging.error("Error during rename operation: %s", e)
+            logger.error("Error during rename operation: %s", e)
             if isinstance(e, ValueError):
                 raise
             return False, []
@@ -153,17 +160,18 @@ class FileManager:
             raise ValueError("Invalid file path")
 
         try:
-            success, updated_files = self.atomic_ops.atomic_create(
+            success = self.atomic_ops.atomic_create(
                 file_path,
                 content
             )
+            updated_files = [file_path] if success else []
 
             if success:
-                self.graph_manager.update_graph()
+                self.graph_manager.apply_patch(GraphPatch(created=[file_path]))
 
             return success, updated_files
         except Exception as e:
-            logging.error("Error in atomic create: %s", e)
+            logger.error("Error in atomic create: %s", e)
             if isinstance(e, ValueError):
                 raise
             return False, []
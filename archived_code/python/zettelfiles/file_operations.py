@@ -1,10 +1,12 @@
 import os
-import shutil
 import logging
-from typing import List, Tuple, Dict
-from .zettelrename import rename_and_update_links, find_links_to_file, update_links_in_file
+from typing import List, Tuple, Dict, Optional
+from .atomic_ops import move_path, atomic_write, transaction
+from .zettelrename import rename_and_update_links, find_links_to_files, update_links_in_file
 from .utils import get_next_available_child_id
-from .file_graph import FileGraph
+from .file_graph import FileGraph, GraphPatch
+
+logger = logging.getLogger(__name__)
 
 def get_file_paths(base_dir: str, stable_ids: List[str], graph_data: dict) -> List[str]:
     """Get full file paths for multiple nodes using their stable IDs"""
@@ -13,24 +15,9 @@ def get_file_paths(base_dir: str, stable_ids: List[str], graph_data: dict) -> Li
     else:
         return get_file_path(base_dir, stable_ids, graph_data)
 
-def get_file_path(base_dir: str, stable_id: str, graph_data: dict) -> str:
+def get_file_path(base_dir: str, stable_id: str, graph: FileGraph) -> str:
     """Get full file path for a node using its stable ID"""
-    node_data = graph_data.node_props(stable_id)
-
-    # graph_data = graph_data.to_dict()
-    # node_data = graph_data["nodes"].get(stable_id)
-    if not node_data:
-        raise ValueError(f"Node not found: {stable_id}")
-
-    # Construct filename based on whether node has a Folgezettel ID
-    if node_data["id"]:
-        filename = f"{node_data['id']} {node_data['name']}{node_data['extension']}"
-    else:
-        filename = f"{node_data['name']}{node_data['extension']}"
-
-    # Combine with path
-    rel_path = os.path.join(node_data["path"] or "", filename)
-    return os.path.join(base_dir, rel_path)
+    return os.path.join(base_dir, graph.rel_path(stable_id))
 
 def get_file_paths_from_stable_ids(base_dir: str, stable_ids: List[str], graph_data: dict) -> List[str]:
     """Get full file paths for multiple nodes using their stable IDs"""
@@ -41,7 +28,7 @@ def move_files(
     source_stable_ids: List[str],
     target_stable_id: str,
     graph: FileGraph
-) -> Tuple[bool, List[str], FileGraph]:
+) -> Tuple[bool, List[str], FileGraph, GraphPatch]:
     """
     Move files to target location and update their folgezettel IDs.
 
@@ -52,16 +39,18 @@ def move_files(
         graph: Current graph state
 
     Returns:
-        Tuple[bool, List[str], dict]:
+        Tuple[bool, List[str], FileGraph, GraphPatch]:
             - Success flag
             - List of updated file paths
             - Updated graph
+            - Patch describing the moves that were carried out
     """
     if not isinstance(source_stable_ids, List):
         source_stable_ids = [source_stable_ids]
+    patch = GraphPatch()
     try:
         updated_files = set()
-        print("whoop de do, I'm being moved")
+        logger.debug("move_files sources=%s target=%s", source_stable_ids, target_stable_id)
 
         # Validate target exists
         if target_stable_id not in graph.all_nodes:
@@ -72,78 +61,116 @@ def move_files(
         target_path = graph.paths[target_stable_id]
         # target_node['path'] if target_node['is_directory'] else os.path.dirname(target_node['path'])
 
-        # Process each source file
-        for source_stable_id in source_stable_ids:
-            if source_stable_id not in graph.all_nodes:
-                raise ValueError(f"Source node not found: {source_stable_id}")
-
-            source_node = graph.node_props(source_stable_id) #graph['nodes'][source_stable_id]
-
-            # Get current paths
-            old_path = get_file_paths(base_dir, source_stable_id, graph)
-            print("Old path is ",old_path, "stable id", source_stable_id)
-            # Construct new path (initially without new ID)
-            filename = os.path.basename(old_path)
-            new_path = os.path.join(base_dir, target_path, filename)
-
-            # First move the file to target directory if paths are different
-            if old_path != new_path:
-                os.makedirs(os.path.dirname(new_path), exist_ok=True)
-                shutil.move(old_path, new_path)
-
-            # Get new folgezettel ID if target has one
-            if target_node.get('id'):
-                new_id = get_next_available_child_id(graph.folgezettel_ids[target_stable_id], graph)
-                if new_id:  # Only rename if we got a valid new ID
-                    # Construct final path with new ID
-                    new_filename = f"{new_id} {source_node['name']}{source_node['extension']}"
-                    final_path = os.path.join(os.path.dirname(new_path), new_filename)
-
-                    # Rename file and update links
-                    success, affected_files = rename_and_update_links(
-                        base_dir,
-                        new_path,
-                        final_path,
-                        source_node['id'],
-                        source_node['name'],
-                        new_id,
-                        source_node['name']
-                    )
-
-                    if success:
+        # Linking files are found before later sources of the batch move, and a
+        # source can itself link to an earlier one, so their paths are passed
+        # through the moves done so far (see change_folgezettel_ids)
+        moved: Dict[str, str] = {}
+
+        def current_path(path: str) -> str:
+            return moved.get(os.path.normpath(path), path)
+
+        # Process each source file; if any step fails, everything done so far
+        # (file moves, renames, link rewrites and graph edits) is undone
+        with transaction() as tx:
+            for source_stable_id in source_stable_ids:
+                if source_stable_id not in graph.all_nodes:
+                    raise ValueError(f"Source node not found: {source_stable_id}")
+
+                source_node = graph.node_props(source_stable_id) #graph['nodes'][source_stable_id]
+                old_parent = graph.parents.get(source_stable_id)
+
+                # Get current paths
+                old_path = get_file_paths(base_dir, source_stable_id, graph)
+                logger.debug("Moving %s (stable id %s)", old_path, source_stable_id)
+                # Construct new path (initially without new ID)
+                filename = os.path.basename(old_path)
+                new_path = os.path.join(base_dir, target_path, filename)
+
+                # First move the file to target directory if paths are different
+                if old_path != new_path:
+                    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                    move_path(old_path, new_path)
+                    tx.push_undo(lambda src=old_path, dst=new_path: move_path(dst, src))
+
+                # Get new folgezettel ID if target has one
+                new_id = source_node['id']
+                if target_node.get('id'):
+                    new_id = get_next_available_child_id(graph.folgezettel_ids[target_stable_id], graph)
+                    if new_id:  # Only rename if we got a valid new ID
+                        # Construct final path with new ID
+                        new_filename = f"{new_id} {source_node['name']}{source_node['extension']}"
+                        final_path = os.path.join(os.path.dirname(new_path), new_filename)
+
+                        # Rename file and update links
+                        success, affected_files = rename_and_update_links(
+                            base_dir,
+                            new_path,
+                            final_path,
+                            source_node['id'],
+                            source_node['name'],
+                            new_id,
+                            source_node['name']
+                        )
+
+                        if not success:
+                            raise Exception(f"Failed to rename {new_path} to {final_path}")
                         updated_files.update(affected_files)
-                        print("adding ", affected_files, "to updated_files", updated_files)
-
-                        # Update node in graph
-                        # graph['nodes'][source_stable_id].update({
-                        #     'id': new_id,
-                        #     'path': target_path
-                        # })
-                        graph.folgezettel_ids[source_stable_id] = new_id
-                        graph.paths[source_stable_id] = target_path
+                        logger.debug("Links updated in %s", affected_files)
+                        # Later sources are back in place by the time this runs
+                        tx.push_undo(lambda src=new_path, dst=final_path, files=affected_files,
+                                            node=source_node, new_id=new_id:
+                                     _undo_rename(src, dst, [current_path(f) for f in files], node, new_id))
+                        new_path = final_path
                     else:
-                        raise Exception(f"Failed to rename {new_path} to {final_path}")
-            else:
-                # Just update the path in the graph
-                # graph['nodes'][source_stable_id]['path'] = target_path
-                graph.paths[source_stable_id] = target_path
-
-            # Update edges in graph
-            # Remove from old parent
-            old_parent = next((pid for pid, children in graph.edges.items()
-                             if source_stable_id in children), None)
-            if old_parent:
-                graph.edges[old_parent].remove(source_stable_id)
-                # graph['edges'][old_parent].remove(source_stable_id)
+                        new_id = source_node['id']
 
-            # Add to new parent
-            graph.edges[target_stable_id].add(source_stable_id)
-
-        return True, list(updated_files), graph
+                # Update node in graph and move its edge from the old parent to the new one
+                graph.folgezettel_ids[source_stable_id] = new_id
+                graph.paths[source_stable_id] = target_path
+                graph.link(target_stable_id, source_stable_id)
+                tx.push_undo(lambda sid=source_stable_id, node=source_node, parent=old_parent:
+                             _restore_node(graph, sid, node, parent))
+                # The patch finds the node under its new parent already, so the
+                # surrogates it leaves without children are dropped here
+                pruned = graph.prune_surrogates(old_parent)
+                tx.push_undo(lambda removed=pruned: _restore_surrogates(graph, removed))
+                patch.moved.append((source_stable_id, target_path, new_id))
+
+                key = os.path.normpath(old_path)
+                moved[key] = new_path
+                tx.push_undo(lambda key=key: moved.pop(key))
+
+        updated_files = list({current_path(path) for path in updated_files})
+        # Linking notes whose links were rewritten have new stable IDs
+        patch.rewritten.extend(updated_files)
+        return True, updated_files, graph, patch
 
     except Exception as e:
-        logging.error("Error during move operation: %s", e, exc_info=True)
-        return False, [], graph
+        logger.error("Error during move operation: %s", e, exc_info=True)
+        # The transaction rolled back every move, so there is nothing left to patch
+        return False, [], graph, GraphPatch()
+
+def _undo_rename(old_path: str, new_path: str, linking_files: List[str], node: dict, new_id: str):
+    """Reverse rename_and_update_links for a file that got a new Folgezettel ID"""
+    move_path(new_path, old_path)
+    for file_path in linking_files:
+        update_links_in_file(file_path, new_id, node['name'], node['id'], node['name'])
+
+def _restore_node(graph: FileGraph, stable_id: str, node: dict, parent: Optional[str]):
+    """Put a node's ID, path and parent edge back to what they were before a move"""
+    graph.folgezettel_ids[stable_id] = node['id']
+    graph.paths[stable_id] = node['path']
+    if parent is None:
+        graph.unlink(stable_id)
+    else:
+        graph.link(parent, stable_id)
+
+def _restore_surrogates(graph: FileGraph, removed: List[Tuple[str, str, Optional[str]]]):
+    """Put back surrogates removed by prune_surrogates, top of the chain first"""
+    for stable_id, folgezettel_id, parent in reversed(removed):
+        graph.add_node(stable_id, folgezettel_id, f"Surrogate {folgezettel_id}", ".", is_surrogate=True)
+        if parent is not None:
+            graph.link(parent, stable_id)
 
 def delete_files(base_dir: str, stable_ids: List[str], graph_data: dict) -> Tuple[bool, List[str]]:
     """Delete files and update links"""
@@ -155,35 +182,41 @@ def delete_files(base_dir: str, stable_ids: List[str], graph_data: dict) -> Tupl
             deleted_files.append(file_path)
         return True, deleted_files
     except Exception as e:
-        logging.error("Error deleting files: %s", e)
+        logger.error("Error deleting files: %s", e)
         return False, []
 
 def change_folgezettel_ids(
     base_dir: str,
     old_id: str,
     new_id: str,
-    graph_data: dict
+    graph: FileGraph
 ) -> Tuple[bool, List[str]]:
     """Change Folgezettel IDs for a node and its children"""
     try:
         updated_files = []
 
         # Find all affected nodes (node itself and children)
-        affected_nodes = [
-            stable_id for stable_id, node in graph_data["nodes"].items()
-            if node["id"] and (
-                node["id"] == old_id or
-                (len(node["id"]) > len(old_id) and node["id"].startswith(old_id))
-            )
-        ]
+        affected_nodes = graph.find_id_subtree(old_id)
+
+        # Search for links to the whole subtree at once. Notes of the subtree
+        # can link to each other, and the lists hold paths from before any
+        # rename, so each list is passed through the renames done so far.
+        linking_files = find_links_to_files(base_dir, [
+            (graph.node_props(stable_id)["id"], graph.node_props(stable_id)["name"])
+            for stable_id in affected_nodes
+        ])
+        renamed: Dict[str, str] = {}
+
+        def current_path(path: str) -> str:
+            return renamed.get(os.path.normpath(path), path)
 
         for stable_id in affected_nodes:
-            node_data = graph_data["nodes"][stable_id]
+            node_data = graph.node_props(stable_id)
             old_folgezettel_id = node_data["id"]
             new_folgezettel_id = new_id + old_folgezettel_id[len(old_id):] if len(old_folgezettel_id) > len(old_id) else new_id
 
             # Get paths
-            old_path = get_file_path(base_dir, stable_id, graph_data)
+            old_path = get_file_path(base_dir, stable_id, graph)
             new_filename = f"{new_folgezettel_id} {node_data['name']}{node_data['extension']}"
             new_path = os.path.join(base_dir, node_data["path"] or "", new_filename)
 
@@ -195,42 +228,31 @@ def change_folgezettel_ids(
                 old_folgezettel_id,
                 node_data["name"],
                 new_folgezettel_id,
-                node_data["name"]
+                node_data["name"],
+                [current_path(path) for path in linking_files[old_folgezettel_id, node_data["name"]]]
             )
 
             if success:
                 updated_files.extend(affected)
+                renamed[os.path.normpath(old_path)] = new_path
             else:
                 raise Exception(f"Failed to rename {old_path}")
 
-        return True, list(set(updated_files))
+        return True, list({current_path(path) for path in updated_files})
     except Exception as e:
-        logging.error("Error changing Folgezettel IDs: %s", e)
+        logger.error("Error changing Folgezettel IDs: %s", e)
         return False, []
 
 def create_file(path: str, content: str = "") -> bool:
     """Create a new file with optional content"""
     try:
         os.makedirs(os.path.dirname(path), exist_ok=True)
-        with open(path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        atomic_write(path, content)
         return True
     except Exception as e:
-        logging.error("Error creating file: %s", e)
+        logger.error("Error creating file: %s", e)
         return False
 
-def get_obsidian_path(base_dir: str, stable_id: str, graph_data: dict) -> str:
+def get_obsidian_path(base_dir: str, stable_id: str, graph: FileGraph) -> str:
     """Get the full path for opening a file in Obsidian"""
-    node_data = graph_data["nodes"].get(stable_id)
-    if not node_data:
-        raise ValueError(f"Node not found: {stable_id}")
-
-    # Construct filename based on whether node has a Folgezettel ID
-    if node_data["id"]:
-        filename = f"{node_data['id']} {node_data['name']}{node_data['extension']}"
-    else:
-        filename = f"{node_data['name']}{node_data['extension']}"
-
-    # Combine with path
-    rel_path = os.path.join(node_data["path"] or "", filename)
-    return os.path.join(base_dir, rel_path)
+    return get_file_path(base_dir, stable_id, graph)
@@ -3,20 +3,53 @@ import json
 import os
 import logging
 import hashlib
-from .utils import is_valid_node_id, get_parent_id, validate_node
+from .utils import get_parent_id, split_node_name
 from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional, Tuple, Union
+from .scan_cache import ListingCache
 
-def get_file_creation_time(path: str) -> str:
-    """Get file creation time with nanosecond precision as a string"""
-    stat = os.stat(path)
+def get_file_creation_time(path: Union[str, os.DirEntry]) -> str:
+    """Get file creation time with nanosecond precision as a string
+
+    Accepts a DirEntry from os.scandir so a directory walk can reuse its cached stat.
+    """
+    return _creation_time(path.stat() if isinstance(path, os.DirEntry) else os.stat(path))
+
+def _creation_time(stat: os.stat_result) -> str:
     # Use the earliest time we can find (creation time on Windows, earliest of ctime/mtime on Unix)
     creation_time = min(stat.st_ctime_ns, stat.st_mtime_ns)
     # Return nanosecond timestamp as string
     return str(creation_time)
 
+try:
+    import xxhash
+except ImportError:  # optional speedup (pip install zettelfiles[speedups])
+    xxhash = None
+
+try:
+    import orjson
+except ImportError:  # optional speedup (pip install zettelfiles[speedups])
+    orjson = None
+
 def get_dir_hash(path: str) -> str:
-    """Get stable hash of directory path"""
-    return hashlib.md5(path.encode()).hexdigest()
+    """
+    Get stable hash of a directory's path relative to the vault root.
+
+    Directory IDs only need to be unique within a vault, so a 64-bit non-crypto
+    hash is plenty: xxh3 when xxhash is installed, else an 8-byte BLAKE2b.
+    """
+    path_hash = _new_dir_hash()
+    path_hash.update(path.encode())
+    return path_hash.hexdigest()
+
+def _new_dir_hash():
+    """Empty streaming state of get_dir_hash's hash, to be fed a path piece by piece"""
+    if xxhash is not None:
+        return xxhash.xxh3_64()
+    return hashlib.blake2b(digest_size=8)
+
+_SEP = os.sep.encode()
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -24,23 +57,58 @@ logging.basicConfig(level=logging.INFO)
 # Define supported file types
 SUPPORTED_EXTENSIONS = {'.md', '.txt', '.nb', '.pdf'}
 
-class GraphNode:
-    __slots__ = ['name', 'path', 'is_directory', 'id', 'extension', 'is_surrogate']
+# readdir/stat release the GIL, so walking several directories at once overlaps their I/O
+SCAN_WORKERS = min(32, (os.cpu_count() or 1) * 2)
 
-    def __init__(self, name, path, is_directory=False, is_surrogate=False):
-        self.name = name
-        self.path = os.path.normpath(path)
-        self.is_directory = is_directory
-        self.id = ""  # Will be populated for ID-based files
-        self.extension = ""  # For files only
-        self.is_surrogate = is_surrogate
+# (name, full path, pending scan if a directory, stat if a file)
+ScanEntry = Tuple[str, str, Optional[Future], Optional[os.stat_result]]
 
-def build_combined_graph(directory: str) -> dict:
+def _scan_directory(path: str, executor: ThreadPoolExecutor, cache: Optional[ListingCache]) -> List[ScanEntry]:
+    """
+    List a directory for build_combined_graph on a worker thread.
+
+    Returns its subdirectories and supported files sorted by name. Subdirectories
+    come with their own scan, already submitted, and files with their stat. The
+    names are reused from the listing cache when the directory's mtime hasn't
+    changed.
+    """
+    names = None
+    if cache is not None:
+        mtime_ns = os.stat(path).st_mtime_ns
+        names = cache.get(path, mtime_ns)
+    if names is None:
+        # Classify while reading and drop unsupported files, so only entries
+        # that become nodes are sorted (names are unique, so the tuples sort by name)
+        names = []
+        with os.scandir(path) as it:
+            for e in it:
+                if e.is_dir():
+                    names.append((e.name, True))
+                elif os.path.splitext(e.name)[1].lower() in SUPPORTED_EXTENSIONS:
+                    names.append((e.name, False))
+        names.sort()
+    if cache is not None:
+        cache.put(path, mtime_ns, names)
+
+    # Only a root given with a trailing separator ends in one
+    prefix = path if path.endswith(os.sep) else path + os.sep
+    listing = []
+    for name, is_dir in names:
+        full_path = prefix + name
+        if is_dir:
+            listing.append((name, full_path, executor.submit(_scan_directory, full_path, executor, cache), None))
+        else:
+            listing.append((name, full_path, None, os.stat(full_path)))
+    return listing
+
+def build_combined_graph(directory: str, use_cache: bool = False) -> dict:
     """
     Build a combined graph that includes both ID and non-ID hierarchies.
 
     Args:
         directory (str): Path to the root directory
+        use_cache (bool): Reuse directory listings from the previous build of this
+            directory where the directory hasn't changed (see scan_cache)
 
     Returns:
         dict: {
@@ -60,142 +128,176 @@ def build_combined_graph(directory: str) -> dict:
         raise ValueError(f"Path is not a directory: {directory}")
 
     logging.info(f"Building combined graph for directory: {directory}")
-    nodes = {}  # path -> GraphNode
+    # Node attributes as parallel columns keyed by node key (struct-of-arrays):
+    # the edge phase only reads ids, paths and directory flags, and no per-node
+    # object is built just to be copied into a dict at the end.
+    # node_name also carries the node order.
+    node_name = {}
+    node_path = {}
+    node_id = {}
+    node_ext = {}
+    node_is_dir = {}
+    node_is_surrogate = {}
+
+    def add_node(node_key, folgezettel, name, path, ext="", is_dir=False, is_surrogate=False):
+        node_name[node_key] = name
+        node_path[node_key] = path
+        node_id[node_key] = folgezettel
+        node_ext[node_key] = ext
+        node_is_dir[node_key] = is_dir
+        node_is_surrogate[node_key] = is_surrogate
+
     seen_paths = set()
     parent_cache = {}
 
-    def process_directory(current_dir, relative_path=""):
-        logging.debug(f"Processing directory: {current_dir}")
-        logging.debug(f"Relative path: {relative_path}")
+    def enter_directory(dir_name, relative_path, listing, path_hash=None):
+        """
+        Add the node for a directory and return its sorted entries, or None to skip it.
+
+        relative_path is built by concatenating entry names onto the root's ".",
+        so it is already normalized. path_hash is the hash state already fed it,
+        so the walk hashes each path segment once instead of every full path
+        (the root, which has none, hashes its path directly).
+        """
+        logging.debug(f"Processing directory: {relative_path}")
 
-        relative_path = os.path.normpath(relative_path)
         if relative_path in seen_paths:
             logging.warning(f"Skipping circular reference: {relative_path}")
-            return
+            return None
         seen_paths.add(relative_path)
 
         # Add node for current directory (except root)
         if relative_path:
-            dir_name = os.path.basename(current_dir)
-            node = GraphNode(dir_name, relative_path, is_directory=True)
             # Check for ID
-            parts = dir_name.split(None, 1)
-            if len(parts) > 1 and is_valid_node_id(parts[0]):
-                node.id = parts[0]
-                node.name = parts[1]
-            else:
-                node.name = dir_name
+            dir_id, name = split_node_name(dir_name)
 
-            # Use directory hash as stable ID
-            node_key = f"dir_{get_dir_hash(current_dir)}"
-            nodes[node_key] = node
-            validate_node(nodes[node_key])
+            # Use hash of the vault-relative path as stable ID, so it survives moving the vault
+            node_key = f"dir_{path_hash.hexdigest() if path_hash is not None else get_dir_hash(relative_path)}"
+            add_node(node_key, dir_id, name, relative_path, is_dir=True)
 
-        # Get all entries first
-        entries = os.listdir(current_dir)
-
-        # Process all entries
-        for entry in sorted(entries):
-            full_path = os.path.join(current_dir, entry)
-            entry_rel_path = os.path.join(relative_path, entry) if relative_path else entry
+        # Children's paths and hashes extend this directory's with a separator
+        # and their name (the root's children start from scratch)
+        if path_hash is None:
+            dir_path, prefix_hash = "", _new_dir_hash()
+        else:
+            dir_path, prefix_hash = relative_path, path_hash
+            prefix_hash.update(_SEP)
+        rel_prefix = dir_path + os.sep if dir_path else ""
+
+        # Wait for the worker's listing; scandir hands back the type from the
+        # directory read, so telling files from directories costs no extra stat
+        return iter(listing.result()), dir_path, rel_prefix, prefix_hash
+
+    def process_file(file_name, stat, dir_path):
+        name, ext = os.path.splitext(file_name)
+
+        # For files, use creation time as stable ID (from the worker's stat)
+        node_key = _creation_time(stat)
+
+        logging.debug(f"Processing file: {file_name} in {dir_path!r}")
+
+        # Store Folgezettel ID if present, but don't use it as key
+        file_id, name = split_node_name(name)
+
+        # Store just the directory part of the path ('' at the root)
+        add_node(node_key, file_id, name, dir_path, ext)
+
+    # Depth-first walk with an explicit stack of open directory listings, so deep
+    # vaults can't hit the recursion limit; nodes come out in the same pre-order
+    # (a subdirectory's contents right after its entry) as a recursive walk.
+    # Listings are read ahead by a thread pool, and this loop only consumes them
+    # in order, so the node order doesn't depend on which scan finishes first.
+    cache = ListingCache(directory).load() if use_cache else None
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as executor:
+        root_listing = executor.submit(_scan_directory, directory, executor, cache)
+        stack = [enter_directory(os.path.basename(directory), ".", root_listing)]
+        while stack:
+            entries, dir_path, rel_prefix, prefix_hash = stack[-1]
+            entry = next(entries, None)
+            if entry is None:
+                stack.pop()
+                continue
 
-            if os.path.isdir(full_path):
-                # For directories, use path hash as stable ID
-                # node_key = f"dir_{get_dir_hash(full_path)}" # Not actually used
-                process_directory(full_path, entry_rel_path)
+            entry_name, entry_path, listing, stat = entry
+            if listing is not None:
+                path_hash = prefix_hash.copy()
+                path_hash.update(entry_name.encode())
+                child = enter_directory(entry_name, rel_prefix + entry_name, listing, path_hash)
+                if child is not None:
+                    stack.append(child)
             else:
-                # For files, use creation time as stable ID
-                node_key = get_file_creation_time(full_path)
-
-                name, ext = os.path.splitext(entry)
-                if ext.lower() not in SUPPORTED_EXTENSIONS:
-                    logging.debug(f"Skipping unsupported file type: {entry}")
-                    continue
-
-                node = GraphNode(name, entry_rel_path)
-                node.extension = ext
-                logging.debug(f"Processing file: {entry_rel_path}")
-
-                # Store Folgezettel ID if present, but don't use it as key
-                parts = name.split(None, 1)
-                if len(parts) > 1 and is_valid_node_id(parts[0]):
-                    node.id = parts[0]
-                    node.name = parts[1]
-                else:
-                    node.name = name
-
-                # Store just the directory part of the path
-                node.path = os.path.dirname(entry_rel_path)
-                if node.path == '.':
-                    node.path = ''
-
-                nodes[node_key] = node
-
-    # Start node creation
-    process_directory(directory)
+                process_file(entry_name, stat, dir_path)
+    if cache is not None:
+        cache.save()
 
     # Phase 2: Create edges using stable IDs
     edges = defaultdict(set)
     id_nodes = set()
     folder_nodes = set()
 
-    # Create a copy of nodes.items() to iterate over
-    nodelist = list(nodes.items())
-    for node_key, node in nodelist:
+    # Index parents once so each edge is a dict lookup rather than a scan over
+    # every node; setdefault keeps the first node seen, as the scans used to
+    id_to_key = {}
+    path_to_key = {}
+    for k, folgezettel in node_id.items():
+        if folgezettel:
+            id_to_key.setdefault(folgezettel, k)
+    for k, is_dir in node_is_dir.items():
+        if is_dir:
+            path_to_key.setdefault(node_path[k], k)
+
+    # Surrogates appended to the list are visited too
+    nodelist = list(node_name)
+    for node_key in nodelist:
+        folgezettel = node_id[node_key]
+        is_dir = node_is_dir[node_key]
         # Track node types
-        if node.is_directory:
+        if is_dir:
             folder_nodes.add(node_key)
-        if node.id:
+        if folgezettel:
             id_nodes.add(node_key)
 
         # Step 1: ID-based edges
-        if node.id:
-            parent_id = get_parent_id(node.id)
+        if folgezettel:
+            parent_id = get_parent_id(folgezettel)
             if parent_id:
                 # Find parent node by Folgezettel ID
-                parent_key = next(
-                    (k for k, n in nodes.items() if n.id == parent_id),
-                    None
-                )
+                parent_key = id_to_key.get(parent_id)
                 if parent_key:
                     edges[parent_key].add(node_key)
                 else:
                     # Create surrogate with stable ID
                     surrogate_key = f"surrogate_{parent_id}"
-                    surrogate = GraphNode(f"Surrogate {parent_id}", "", False)
-                    surrogate.id = parent_id
-                    nodes[surrogate_key] = surrogate
+                    add_node(surrogate_key, parent_id, f"Surrogate {parent_id}", ".")
+                    id_to_key[parent_id] = surrogate_key
                     id_nodes.add(surrogate_key)
-                    nodelist.append((surrogate_key, surrogate))
+                    nodelist.append(surrogate_key)
                     edges[surrogate_key].add(node_key)
                 continue
 
         # Step 2: Folder-based edges (if no ID edge was created)
-        if node.is_directory:
-            parent_path = os.path.dirname(node.path)
+        if is_dir:
+            parent_path = os.path.dirname(node_path[node_key])
         else:
-            parent_path = node.path  # Use node.path directly - it's already the parent directory path
+            parent_path = node_path[node_key]  # Use the path directly - it's already the parent directory path
 
         if parent_path and parent_path not in ["", "."]:
             # Find parent node by path
-            parent_key = next(
-                (k for k, n in nodes.items() if n.is_directory and n.path == parent_path),
-                None
-            )
+            parent_key = path_to_key.get(parent_path)
             if parent_key and parent_key != node_key:
                 edges[parent_key].add(node_key)
 
     return {
         "nodes": {
             k: {
-                "id": n.id,
-                "name": n.name,
-                "path": n.path,
-                "extension": n.extension,
-                "is_directory": n.is_directory,
-                "is_surrogate": n.is_surrogate
+                "id": node_id[k],
+                "name": node_name[k],
+                "path": node_path[k],
+                "extension": node_ext[k],
+                "is_directory": node_is_dir[k],
+                "is_surrogate": node_is_surrogate[k]
             }
-            for k, n in nodes.items()
+            for k in node_name
         },
         "edges": edges,
         "id_nodes": id_nodes,
@@ -211,6 +313,14 @@ def combined_graph_to_dict(graph):
         "folder_nodes": sorted(list(graph["folder_nodes"]))
     }
 
+def print_json(result: dict) -> None:
+    """Print result as one line of JSON, encoded with orjson when it's installed"""
+    if orjson is None:
+        print(json.dumps(result))
+    else:
+        sys.stdout.buffer.write(orjson.dumps(result) + b"\n")
+        sys.stdout.flush()
+
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         directory = sys.argv[1]
@@ -221,16 +331,16 @@ if __name__ == "__main__":
                 "success": True,
                 "data": combined_graph_to_dict(combined_graph)
             }
-            print(json.dumps(result))
+            print_json(result)
         except Exception as e:
-            print(json.dumps({
+            print_json({
                 "success": False,
                 "error": str(e),
                 "data": None
-            }))
+            })
     else:
-        print(json.dumps({
+        print_json({
             "success": False,
             "error": "No directory specified",
             "data": None
-        }))
+        })
@@ -1,45 +1,184 @@
 from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler, FileSystemEvent
-from .file_graph import FileGraph
+from watchdog.events import (
+    FileSystemEventHandler, FileSystemEvent,
+    FileCreatedEvent, FileDeletedEvent, FileMovedEvent, FileModifiedEvent,
+    DirCreatedEvent, DirDeletedEvent, DirMovedEvent,
+)
+from .file_graph import FileGraph, GraphPatch
+from .file_operations import get_file_path
+from .error_handling import InconsistentGraph
 import asyncio
-from typing import Callable, Optional
+import logging
+import os
+from collections import OrderedDict, deque
+from typing import Callable, Iterable, List, Optional, Tuple, Union
 
 class GraphManager:
-    def __init__(self):
+    def __init__(self, event_latency: float = 0.05, notify_latency: float = 0.1, path_cache_size: int = 1024,
+                 use_cache: bool = False):
         self.graph = None
+        # Full rebuilds reuse the directory listings of unchanged folders (see scan_cache)
+        self.use_cache = use_cache
         self.observer = None
         self.base_dir = None
         self.update_callback = None
+        # Watcher events arriving within event_latency seconds are coalesced into one update
+        self.event_latency = event_latency
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending_events = deque()
+        self._drain_handle: Optional[asyncio.TimerHandle] = None
+        # Graph changes within notify_latency seconds are sent to update_callback once
+        self.notify_latency = notify_latency
+        self._notify_handle: Optional[asyncio.TimerHandle] = None
+        # The UI keeps asking for the paths of the same few notes; remember the last
+        # path_cache_size lookups until a change touches them
+        self.path_cache_size = path_cache_size
+        self._path_cache: OrderedDict[Tuple[str, str], str] = OrderedDict()  # (base_dir, stable_id) -> path
     
     def initialize_graph(self, directory: str) -> FileGraph:
         self.base_dir = directory
         self.graph = FileGraph()
-        self.graph.build_from_directory(directory)
+        self.graph.build_from_directory(directory, use_cache=self.use_cache)
+        self._path_cache.clear()
         return self.graph
+
+    def get_file_path(self, base_dir: str, stable_id: str) -> str:
+        """Full path of a node's file, from the path cache if it was looked up recently"""
+        key = (base_dir, stable_id)
+        path = self._path_cache.get(key)
+        if path is not None:
+            self._path_cache.move_to_end(key)
+            return path
+        path = get_file_path(base_dir, stable_id, self.graph)
+        self._path_cache[key] = path
+        if len(self._path_cache) > self.path_cache_size:
+            self._path_cache.popitem(last=False)
+        return path
+
+    def get_file_paths(self, base_dir: str, stable_ids: Union[List[str], str]) -> Union[List[str], str]:
+        """get_file_path for each of stable_ids (or for a single stable ID)"""
+        if isinstance(stable_ids, List):
+            return [self.get_file_path(base_dir, stable_id) for stable_id in stable_ids]
+        return self.get_file_path(base_dir, stable_ids)
+
+    def get_obsidian_path(self, base_dir: str, stable_id: str) -> str:
+        """Get the full path for opening a file in Obsidian"""
+        return self.get_file_path(base_dir, stable_id)
+
+    def _invalidate_paths(self, stable_ids: Iterable[str] = (), paths: Iterable[str] = ()):
+        """Drop cached paths of the given nodes and of anything in the directories of paths"""
+        stable_ids = set(stable_ids)
+        dirs = {os.path.dirname(os.path.normpath(path)) for path in paths if path}
+        stale = [
+            key for key, path in self._path_cache.items()
+            if key[1] in stable_ids or os.path.dirname(os.path.normpath(path)) in dirs
+        ]
+        for key in stale:
+            del self._path_cache[key]
     
-    def update_graph(self):
-        """Force a graph update and notify callback"""
+    def update_graph(self, event: Optional[FileSystemEvent] = None):
+        """
+        Update the graph and notify callback: patched in place for a watcher
+        event, otherwise (or if the event can't be applied) rebuilt from disk
+        """
         if self.base_dir:
-            self.graph.build_from_directory(self.base_dir)
-            if self.update_callback:
-                asyncio.create_task(self.update_callback(self.graph))
+            if event is None or not self._apply_events([event]):
+                self.graph.build_from_directory(self.base_dir, use_cache=self.use_cache)
+                self._path_cache.clear()
+            self._notify()
+
+    def _apply_events(self, events) -> bool:
+        """Apply watcher events to the graph in place; False if it needs a rebuild instead"""
+        try:
+            for event in events:
+                self._invalidate_paths(paths=(event.src_path, getattr(event, "dest_path", "")))
+                self.graph.update_from_change(event)
+        except InconsistentGraph as e:
+            logging.info("Watcher event not applicable (%s), rebuilding from disk", e)
+            return False
+        return True
     
+    def apply_patch(self, patch: GraphPatch):
+        """Patch the graph in memory and notify callback, rebuilding only if the patch doesn't fit"""
+        if not self.graph:
+            return
+        self._invalidate_paths(
+            stable_ids=[*patch.deleted, *(m[0] for m in patch.moved), *(r[0] for r in patch.renamed)]
+        )
+        try:
+            self.graph.apply_patch(patch)
+        except InconsistentGraph as e:
+            logging.info("Graph patch not applicable (%s), rebuilding from disk", e)
+            self.update_graph()
+            return
+        self._notify()
+
+    def _notify(self):
+        """
+        Schedule update_callback for the current graph. A file operation patches
+        the graph and then its own watcher events arrive, so changes are gathered
+        for notify_latency seconds and the (whole-graph) callback runs once.
+        """
+        if not self.update_callback or self._notify_handle is not None:
+            return
+        loop = self._loop or asyncio.get_running_loop()
+        self._notify_handle = loop.call_later(self.notify_latency, self._flush_notify)
+
+    def _flush_notify(self):
+        self._notify_handle = None
+        if self.update_callback and self.graph is not None:
+            asyncio.create_task(self.update_callback(self.graph))
+
+    def _queue_event(self, event: FileSystemEvent):
+        """Buffer a watcher event and arm the drain timer (runs on the event loop)"""
+        self._pending_events.append(event)
+        if self._drain_handle is None:
+            self._drain_handle = self._loop.call_later(self.event_latency, self._drain_events)
+
+    def _drain_events(self):
+        """Apply all buffered events in one pass and notify callback once"""
+        self._drain_handle = None
+
+        # Editors save in bursts (temp file, rename, attribute change); keep only
+        # the newest copy of each distinct event, in the order they last occurred
+        latest = {}
+        while self._pending_events:
+            event = self._pending_events.popleft()
+            key = (event.event_type, event.src_path, getattr(event, "dest_path", ""))
+            latest.pop(key, None)
+            latest[key] = event
+
+        if not latest or self.graph is None:
+            return
+        if not self._apply_events(latest.values()):
+            # A rebuild covers whatever events were left
+            self.graph.build_from_directory(self.base_dir, use_cache=self.use_cache)
+            self._path_cache.clear()
+        self._notify()
+
     def watch_directory(self, directory: str, callback: Callable):
         """Set up directory watching with callback for graph updates"""
         self.update_callback = callback
-        
+        # Watchdog calls the handler from its own thread; hop onto this loop to queue events
+        self._loop = asyncio.get_running_loop()
+        loop = self._loop
+
         class Handler(FileSystemEventHandler):
             def on_any_event(self2, event: FileSystemEvent):
-                if event.is_directory:
+                if event.event_type not in FileGraph.interesting_event_types:
                     return
-                # Update graph and notify
-                self.graph.update_from_change(event)
-                if self.update_callback:
-                    asyncio.create_task(self.update_callback(self.graph))
+                loop.call_soon_threadsafe(self._queue_event, event)
         
         if self.observer:
             self.observer.stop()
         
         self.observer = Observer()
-        self.observer.schedule(Handler(), directory, recursive=True)
+        # Narrow the watch itself so the kernel never queues open/close events for us
+        self.observer.schedule(
+            Handler(), directory, recursive=True,
+            event_filter=[
+                FileCreatedEvent, FileDeletedEvent, FileMovedEvent, FileModifiedEvent,
+                DirCreatedEvent, DirDeletedEvent, DirMovedEvent,
+            ],
+        )
         self.observer.start()
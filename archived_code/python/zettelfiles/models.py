@@ -1,12 +1,14 @@
 import os
+from dataclasses import dataclass
 
+@dataclass(slots=True)
 class GraphNode:
-    __slots__ = ['name', 'path', 'is_directory', 'id', 'extension', 'is_surrogate']
-    
-    def __init__(self, name, path, is_directory=False, is_surrogate=False):
-        self.name = name
-        self.path = os.path.normpath(path)
-        self.is_directory = is_directory
-        self.id = ""  # Will be populated for ID-based files
-        self.extension = ""  # For files only
-        self.is_surrogate = is_surrogate
+    name: str
+    path: str
+    is_directory: bool = False
+    id: str = ""  # Will be populated for ID-based files
+    extension: str = ""  # For files only
+    is_surrogate: bool = False
+
+    def __post_init__(self):
+        self.path = os.path.normpath(self.path)
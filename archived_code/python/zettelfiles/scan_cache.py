@@ -0,0 +1,97 @@
+import os
+import time
+import pickle
+import hashlib
+import logging
+from typing import Dict, List, Optional, Tuple
+from .atomic_ops import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the pickled layout changes; older caches are then ignored
+CACHE_VERSION = 2
+
+# A directory modified this close to being listed may change again within the same
+# mtime tick, so its listing isn't trusted on the next run
+RACY_WINDOW_NS = 2_000_000_000
+
+# Caches of this many vaults are kept; saving drops the least recently saved others
+MAX_CACHED_VAULTS = 8
+
+Listing = List[Tuple[str, bool]]  # (entry name, is directory) of dirs and supported files, sorted by name
+
+def get_cache_dir() -> str:
+    """Directory holding listing caches ($ZETTELFILES_CACHE_DIR, else the XDG cache dir)"""
+    if os.environ.get("ZETTELFILES_CACHE_DIR"):
+        return os.environ["ZETTELFILES_CACHE_DIR"]
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "zettelfiles")
+
+class ListingCache:
+    """
+    Directory listings from the previous build of one vault, keyed by directory
+    path and validated by the directory's mtime.
+
+    A directory's mtime changes whenever an entry is added, removed or renamed,
+    so an unchanged mtime means the cached names can be reused without reading
+    the directory again. File contents are not cached; files are still stat'ed
+    for their stable IDs.
+    """
+    def __init__(self, root: str, cache_dir: Optional[str] = None):
+        root_hash = hashlib.md5(os.path.abspath(root).encode()).hexdigest()
+        self.path = os.path.join(cache_dir or get_cache_dir(), f"{root_hash}.pkl")
+        self._previous: Dict[str, Tuple[int, Listing]] = {}
+        self._current: Dict[str, Tuple[int, Listing]] = {}
+        self._started_ns = time.time_ns()
+
+    def load(self) -> 'ListingCache':
+        """Read the previous build's listings; a missing or unreadable cache is just empty"""
+        try:
+            with open(self.path, 'rb') as f:
+                version, listings = pickle.load(f)
+            if version == CACHE_VERSION:
+                self._previous = listings
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.debug("Ignoring unreadable listing cache %s: %s", self.path, e)
+        return self
+
+    def get(self, path: str, mtime_ns: int) -> Optional[Listing]:
+        cached = self._previous.get(path)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1]
+        return None
+
+    def put(self, path: str, mtime_ns: int, listing: Listing) -> None:
+        """Record a listing for the next build (called from scan worker threads)"""
+        if self._started_ns - mtime_ns >= RACY_WINDOW_NS:
+            self._current[path] = (mtime_ns, listing)
+
+    def save(self) -> None:
+        """Replace the on-disk cache with this build's listings"""
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            atomic_write(self.path, pickle.dumps((CACHE_VERSION, self._current), pickle.HIGHEST_PROTOCOL))
+        except OSError as e:
+            logger.debug("Could not write listing cache %s: %s", self.path, e)
+            return
+        prune_cache_dir(os.path.dirname(self.path))
+
+def prune_cache_dir(cache_dir: str, keep: int = MAX_CACHED_VAULTS) -> None:
+    """Remove all but the keep most recently saved listing caches in cache_dir"""
+    try:
+        with os.scandir(cache_dir) as it:
+            caches = [
+                (e.stat().st_mtime_ns, e.path) for e in it
+                # Only our own files: an md5 hex digest plus .pkl
+                if len(e.name) == 36 and e.name.endswith(".pkl") and e.is_file()
+            ]
+    except OSError:
+        return
+    caches.sort(reverse=True)
+    for _, path in caches[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
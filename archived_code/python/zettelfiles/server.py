@@ -3,10 +3,9 @@ from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import logging
 import asyncio
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from .graph_manager import GraphManager
 from .file_manager import FileManager
-from .file_operations import get_file_paths, get_obsidian_path, move_files
 from .error_handling import (
     setup_logging,
     handle_error,
@@ -17,13 +16,20 @@ from .error_handling import (
 )
 import logging
 import os
+import json
+
+try:
+    import orjson
+except ImportError:  # optional speedup (pip install zettelfiles[speedups])
+    orjson = None
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 setup_logging()
 
 app = FastAPI()
-manager = GraphManager()
+# The server rebuilds the same vault over and over, so it keeps a listing cache
+manager = GraphManager(use_cache=True)
 
 app.add_middleware(
     CORSMiddleware,
@@ -33,6 +39,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+async def send_graph(websocket: WebSocket, graph, message_type: str = "success",
+                     subtree: str = ".", max_depth: Optional[int] = None):
+    """
+    Send a graph message, with the graph serialized straight from its columns;
+    a subtree or max_depth sends just that part (see FileGraph.to_json_view)
+    """
+    if message_type == "success":
+        head, tail = '{"type":"success","data":{"success":true,"data":', '}}'
+    else:
+        head, tail = f'{{"type":{json.dumps(message_type)},"data":', '}'
+    if subtree == "." and max_depth is None:
+        body = graph.to_json_sorted()
+    else:
+        body = graph.to_json_view(subtree, max_depth)
+    await websocket.send_text(head + body + tail)
+
+async def send_message(websocket: WebSocket, message: dict):
+    """send_json, encoded with orjson when it's installed (still as a text frame)"""
+    if orjson is None:
+        await websocket.send_json(message)
+    else:
+        await websocket.send_text(orjson.dumps(message).decode())
+
+async def receive_message(websocket: WebSocket) -> Any:
+    """receive_json, decoded with orjson when it's installed"""
+    if orjson is None:
+        return await websocket.receive_json()
+    return orjson.loads(await websocket.receive_text())
+
 @app.get("/health")
 async def health_check():
     """Simple health check endpoint"""
@@ -48,7 +83,7 @@ async def websocket_endpoint(websocket: WebSocket):
         
         while True:
             try:
-                data = await websocket.receive_json()
+                data = await receive_message(websocket)
                 command = data.get("command")
                 params = data.get("params", {})
                 
@@ -59,30 +94,34 @@ async def websocket_endpoint(websocket: WebSocket):
                     if command == "initialize":
                         directory = params["directory"]
                         graph = manager.initialize_graph(directory)
-                        await websocket.send_json({
-                            "type": "success",
-                            "data": {
-                                "success": True,
-                                "data": graph.to_dict()
-                            }
-                        })
+                        await send_graph(websocket, graph)
                     
                     elif command == "get_graph":
+                        # With a depth, just the top levels are sent for a quick first
+                        # view; folders below come marked has_children and are fetched
+                        # with expand_node. The whole graph is loaded either way, so
+                        # the other commands work on it.
                         directory = params["directory"]
                         graph = manager.initialize_graph(directory)
-                        await websocket.send_json({
-                            "type": "success",
-                            "data": {
-                                "success": True,
-                                "data": graph.to_dict()
-                            }
-                        })
+                        await send_graph(websocket, graph, max_depth=params.get("depth"))
+
+                    elif command == "expand_node":
+                        # Folder keys are path hashes, so the folder is named by its 'path'
+                        directory = params["directory"]
+                        if manager.graph is None or manager.base_dir != directory:
+                            manager.initialize_graph(directory)
+                        await send_graph(
+                            websocket,
+                            manager.graph,
+                            subtree=params["path"],
+                            max_depth=params.get("depth", 0)
+                        )
                     
                     elif command == "get_file_paths":
                         directory = params["directory"]
                         node_ids = params["nodeIds"]
-                        paths = get_file_paths(directory, node_ids)
-                        await websocket.send_json({
+                        paths = manager.get_file_paths(directory, node_ids)
+                        await send_message(websocket, {
                             "type": "success",
                             "data": {"paths": paths}
                         })
@@ -97,7 +136,7 @@ async def websocket_endpoint(websocket: WebSocket):
                             target_id
                         )
                         logging.debug(f"Move result: success={success}, files={updated_files}")
-                        await websocket.send_json({
+                        await send_message(websocket, {
                             "type": "success",
                             "data": {"updatedFiles": updated_files}
                         })
@@ -109,7 +148,7 @@ async def websocket_endpoint(websocket: WebSocket):
                             old_path,
                             new_path
                         )
-                        await websocket.send_json({
+                        await send_message(websocket, {
                             "type": "success",
                             "data": {"updatedFiles": updated_files}
                         })
@@ -118,7 +157,7 @@ async def websocket_endpoint(websocket: WebSocket):
                         path = params["path"]
                         content = params.get("content", "")
                         success = await file_manager.create_file(path, content)
-                        await websocket.send_json({
+                        await send_message(websocket, {
                             "type": "success",
                             "data": {"created": success}
                         })
@@ -127,17 +166,13 @@ async def websocket_endpoint(websocket: WebSocket):
                         directory = params["directory"]
                         stable_id = params["stableId"]
                         try:
-                            obsidian_path = get_obsidian_path(
-                                directory,
-                                stable_id,
-                                manager.graph.to_dict()
-                            )
-                            await websocket.send_json({
+                            obsidian_path = manager.get_obsidian_path(directory, stable_id)
+                            await send_message(websocket, {
                                 "type": "success",
                                 "data": {"path": obsidian_path}
                             })
                         except ValueError as e:
-                            await websocket.send_json({
+                            await send_message(websocket, {
                                 "type": "error",
                                 "message": str(e)
                             })
@@ -146,21 +181,20 @@ async def websocket_endpoint(websocket: WebSocket):
                         directory = params["directory"]
                         manager.watch_directory(
                             directory,
-                            lambda update: websocket.send_json({
-                                "type": "graph_update",
-                                "data": update.to_dict()
-                            })
+                            lambda update: send_graph(websocket, update, "graph_update")
                         )
                     else:
                         raise ZettelError(f"Unknown command: {command}")
                         
                 except Exception as e:
-                    await websocket.send_json(
+                    await send_message(
+                        websocket,
                         handle_error(logger, e, command)
                     )
                     
             except Exception as e:
-                await websocket.send_json(
+                await send_message(
+                    websocket,
                     handle_error(logger, e, "websocket_communication")
                 )
     except Exception as e:
@@ -1,9 +1,24 @@
 # %%
 import os
+import re
 import logging
-from typing import List
+from functools import lru_cache
+from typing import List, Tuple
 # from .file_graph import FileGraph
 
+# Two digits, then any number of (non-digit + two digits) groups, optionally a
+# trailing non-digit and finally one special character
+_NODE_ID_RE = re.compile(r'\d{2}(?:\D\d{2})*\D?[!@#$%^&*_]?')
+
+# A name as split_node_name sees it: optional leading whitespace, a node ID, a run
+# of whitespace and the rest. The ID pattern is _NODE_ID_RE with its non-digits
+# narrowed to non-whitespace, since the ID ends at the first whitespace.
+_NODE_NAME_RE = re.compile(r'\s*(\d{2}(?:[^\d\s]\d{2})*[^\d\s]?[!@#$%^&*_]?)\s+(\S.*)', re.DOTALL)
+
+# IDs repeat across every walk and edge step, so the pure ID helpers are memoized
+_ID_CACHE_SIZE = 4096
+
+@lru_cache(maxsize=_ID_CACHE_SIZE)
 def is_valid_node_id(node_id: str) -> bool:
     """
     Validates node ID format:
@@ -11,59 +26,9 @@ def is_valid_node_id(node_id: str) -> bool:
     - Level 1+: Previous + any non-numeric char + optional 2 digits with optional special character at end
       Examples: "07a", "07a01", "07#", "07#01", "07a01b02"
     """
-    if len(node_id) < 2:
-        return False
-
-    # Root level must be exactly 2 digits
-    if len(node_id) == 2:
-        return node_id.isdigit()
-
-    # Check the pattern: 2 digits followed by alternating non-digit and 2 digits
-    pos = 0
-
-    # First two characters must be digits
-    if not node_id[pos:pos+2].isdigit():
-        return False
-    pos += 2
-
-    # Rest of the ID must alternate between:
-    # - one non-digit character
-    # - optionally followed by two digits
-    # - optionally, at the end, a special character
-    while pos < len(node_id):
-        print(pos)
-        # Must have non-digit character
-        if pos >= len(node_id) or node_id[pos].isdigit():
-            return False
-        pos += 1
-
-        # Must follow letter with two digits if more than one character remains.
-        if not node_id[pos - 1].isdigit():
-            if pos <= len(node_id) - 2:
-                if not node_id[pos].isdigit() and not node_id[pos + 1].isdigit():
-                    return False
-
-                # if not node_id[pos].isdigit():
-                #     continue
-                # if pos + 1 >= len(node_id) or not node_id[pos+1].isdigit():
-                #     return False
-                pos += 2
-            elif pos == len(node_id) - 1:
-                # if there's only one character remaining, after a nondigit, it must be a special character
-                if node_id[pos] not in "!@#$%^&*_": return False
-
-        # May have a special character at the very end (following both numeric and nonnumeric stuff)
-        if pos == len(node_id)-1 and node_id[pos] in "!@#$%^&*_":
-            pos += 1
-            continue
-
-    return True
-is_valid_node_id("01a")
-# %%
-# %% Testing
-# %%
-
+    return _NODE_ID_RE.fullmatch(node_id) is not None
 
+@lru_cache(maxsize=_ID_CACHE_SIZE)
 def get_parent_id(node_id: str) -> str:
     """Returns the parent ID based on the node's level"""
     if len(node_id) <= 2:  # Root nodes have no parent
@@ -77,6 +42,17 @@ def get_parent_id(node_id: str) -> str:
         # Otherwise remove last two digits
         return node_id[:-2]
 
+def split_node_name(base_name: str) -> Tuple[str, str]:
+    """
+    Split a file or directory name (without extension) into its Folgezettel ID and name.
+    Returns ("", base_name) when the name doesn't start with a valid ID.
+    """
+    # One match in re's C engine instead of a split plus a validation per file
+    match = _NODE_NAME_RE.fullmatch(base_name)
+    if match is not None:
+        return match[1], match[2]
+    return "", base_name
+
 def get_next_available_child_id(parent_stable_id: str, graph: dict, parent_id: str = None) -> str:
     """
     Get the first available child ID for a given parent node in the graph.
@@ -113,53 +89,51 @@ def get_next_available_child_id(parent_stable_id: str, graph: dict, parent_id: s
         return ''
 
     # Get all children of the parent using graph edges
-    child_ids = set()
-    for child_stable_id in graph.edges.get(parent_stable_id, set()):
-        child_id = graph.folgezettel_ids[child_stable_id] #['nodes'][child_stable_id].get('id', '')
-        if child_id.startswith(parent_id):
-            child_ids.add(child_id)
-
-    # Determine if we should add a number or letter based on parent_id
+    child_ids = (graph.folgezettel_ids.get(child_stable_id, '')
+                 for child_stable_id in graph.edges.get(parent_stable_id, ()))
+    return _first_free_child_id(parent_id, child_ids)
+
+_LETTERS_MASK = (1 << 26) - 1  # bits 0-25 for a-z
+_NUMBERS_MASK = ((1 << 100) - 1) & ~1  # bits 1-99 for 01-99
+
+def _first_free_child_id(parent_id: str, child_ids) -> str:
+    """First child ID of parent_id not taken by any of child_ids"""
+    n = len(parent_id)
+    # Collect the used suffixes as bits of one int, then pick the lowest clear bit
+    used = 0
     if parent_id[-1].isdigit():
         # Parent ends in number, add letters
-        used_letters = {child_id[len(parent_id)]
-                       for child_id in child_ids
-                       if len(child_id) > len(parent_id)}
-
-        # Find first unused letter (a-z)
-        for letter in 'abcdefghijklmnopqrstuvwxyz':
-            if letter not in used_letters:
-                return f"{parent_id}{letter}"
-
-        raise ValueError(f"No available letter suffixes for parent {parent_id}")
-
-    else:
-        # Parent ends in letter (or is root), add two-digit numbers
-        used_numbers = {child_id[len(parent_id):len(parent_id)+2]
-                       for child_id in child_ids
-                       if len(child_id) >= len(parent_id) + 2}
-
-        # Find first unused two-digit number
-        for i in range(1, 100):
-            candidate = f"{i:02d}"
-            if candidate not in used_numbers:
-                return f"{parent_id}{candidate}"
-
+        for child_id in child_ids:
+            if len(child_id) > n and child_id.startswith(parent_id):
+                bit = ord(child_id[n]) - 97  # ord('a')
+                if 0 <= bit < 26:
+                    used |= 1 << bit
+        free = ~used & _LETTERS_MASK
+        if not free:
+            raise ValueError(f"No available letter suffixes for parent {parent_id}")
+        return f"{parent_id}{chr(97 + (free & -free).bit_length() - 1)}"
+
+    # Parent ends in letter (or is root), add two-digit numbers
+    for child_id in child_ids:
+        suffix = child_id[n:n + 2]
+        if len(suffix) == 2 and suffix.isascii() and suffix.isdigit() and child_id.startswith(parent_id):
+            used |= 1 << int(suffix)
+    free = ~used & _NUMBERS_MASK
+    if not free:
         raise ValueError(f"No available number suffixes for parent {parent_id}")
+    return f"{parent_id}{(free & -free).bit_length() - 1:02d}"
 
 def get_all_parent_ids(node_id: str) -> List[str]:
     """Returns all parent IDs for a given node ID, from immediate parent to root"""
-    parents = []
-    current_id = node_id
-
-    while True:
-        parent_id = get_parent_id(current_id)
-        if not parent_id:  # Stop when we hit root level (empty parent)
-            break
-        parents.append(parent_id)
-        current_id = parent_id
+    return list(_parent_chain(node_id))
 
-    return parents
+@lru_cache(maxsize=_ID_CACHE_SIZE)
+def _parent_chain(node_id: str) -> Tuple[str, ...]:
+    # Cached as a tuple so callers can't mutate a shared result
+    parent_id = get_parent_id(node_id)
+    if not parent_id:  # Stop when we hit root level (empty parent)
+        return ()
+    return (parent_id,) + _parent_chain(parent_id)
 
 def get_stable_file_id(filepath: str) -> str:
     """Get the stable ID for a file using nanosecond precision creation time"""
@@ -192,6 +166,10 @@ def get_stable_id_from_folgezettel(graph: 'FileGraph', folgezettel_id: str) -> s
         >>> get_stable_id_from_folgezettel(graph, "01a")
         "123456"
     """
+    index = getattr(graph, "folgezettel_to_stable", None)
+    if index is not None:
+        return index.get(folgezettel_id)
+    # Graphs without the reverse index
     for stable_id, fid in graph.folgezettel_ids.items():
         if fid == folgezettel_id:
             return stable_id
@@ -223,7 +201,6 @@ def get_next_available_child_id(parent_id: str, graph: dict) -> str:
         - Parent '08r03b' -> children like '08r03b01', '08r03b02', etc.
     """
     # Find the parent node's stable ID
-    print("parent fid: ",parent_id)
     parent_stable_id = get_stable_id_from_folgezettel(graph, parent_id)
     # for stable_id, node_data in graph['nodes'].items():
     #     if node_data.get('id') == parent_id:
@@ -234,36 +211,6 @@ def get_next_available_child_id(parent_id: str, graph: dict) -> str:
         raise ValueError(f"Parent node {parent_id} not found in graph")
 
     # Get all children of the parent using graph edges
-    child_ids = set()
-    for child_stable_id in graph.edges.get(parent_stable_id, set()):
-        child_id = graph.folgezettel_ids[child_stable_id]
-        if child_id.startswith(parent_id):
-            child_ids.add(child_id)
-
-    # Determine if we should add a number or letter based on parent_id
-    if parent_id[-1].isdigit():
-        # Parent ends in number, add letters
-        used_letters = {child_id[len(parent_id)]
-                       for child_id in child_ids
-                       if len(child_id) > len(parent_id)}
-
-        # Find first unused letter (a-z)
-        for letter in 'abcdefghijklmnopqrstuvwxyz':
-            if letter not in used_letters:
-                return f"{parent_id}{letter}"
-
-        raise ValueError(f"No available letter suffixes for parent {parent_id}")
-
-    else:
-        # Parent ends in letter (or is root), add two-digit numbers
-        used_numbers = {child_id[len(parent_id):len(parent_id)+2]
-                       for child_id in child_ids
-                       if len(child_id) >= len(parent_id) + 2}
-
-        # Find first unused two-digit number
-        for i in range(1, 100):
-            candidate = f"{i:02d}"
-            if candidate not in used_numbers:
-                return f"{parent_id}{candidate}"
-
-        raise ValueError(f"No available number suffixes for parent {parent_id}")
+    child_ids = (graph.folgezettel_ids.get(child_stable_id, '')
+                 for child_stable_id in graph.edges.get(parent_stable_id, ()))
+    return _first_free_child_id(parent_id, child_ids)
@@ -1,105 +1,273 @@
 import os
 import re
+import json
+import base64
+import mmap
 import subprocess
 import logging
-from typing import List, Tuple
+from contextlib import ExitStack, contextmanager
+from functools import lru_cache
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from .atomic_ops import atomic_write, atomic_writer
 
-def escape_regex(text: str) -> str:
-    """Escape special regex characters in text"""
-    return re.escape(text)
+logger = logging.getLogger(__name__)
+
+# Notes at least this big are rewritten from a memory map instead of read whole
+STREAM_THRESHOLD = 1 << 20
+STREAM_BUFFER = 1 << 16
+
+# Renames come in bursts over the same few notes (and each affected file of a
+# rename asks again), so compiled link patterns are kept around
+_PATTERN_CACHE_SIZE = 1024
 
 def find_links_to_file(base_dir: str, node_id: str, name: str) -> List[str]:
     """Find all files containing links to the specified node using ripgrep"""
-    logging.info('=== Finding Links ===')
-    logging.info('Search parameters: %s', {'base_dir': base_dir, 'node_id': node_id, 'name': name})
+    with iter_links_to_file(base_dir, node_id, name) as paths:
+        return list(paths)
 
-    escaped_name = escape_regex(name)
-    escaped_node_id = escape_regex(node_id)
-
-    # Three patterns to search for:
+@contextmanager
+def iter_links_to_file(base_dir: str, node_id: str, name: str) -> Iterator[Iterator[str]]:
+    """
+    Like find_links_to_file, but gives an iterator that yields each file as
+    soon as ripgrep reports it, so the caller can work on the first files
+    while ripgrep is still walking the rest of the tree. ripgrep is started
+    on entering the block and stopped and reaped on leaving it, however far
+    the iterator got.
+    """
+    # Three forms to search for:
     # 1. Standard link: [[nodeId name]]
     # 2. Just the ID: [[nodeId]]
     # 3. Link with alt text: [[nodeId name|alt text]]
-    patterns = [
-        f"\\[\\[{escaped_node_id} {escaped_name}\\]\\]",
-        f"\\[\\[{escaped_node_id}\\]\\]",
-        f"\\[\\[{escaped_node_id} {escaped_name}\\|[^\\]]*\\]\\]"  # Match any alt text
+    # All three start with a fixed string, so ripgrep searches for those
+    # literally (-F) instead of running a regex over every file. A line with
+    # an unterminated "[[nodeId name|" also counts; update_links_in_file
+    # still only rewrites complete links.
+    literals = _link_literals(node_id, name)
+
+    # One ripgrep run for all forms: the tree is walked once and -l lists
+    # each file once, whichever forms it contains. Only notes whose links we
+    # update are searched (see should_update_links), so attachments are
+    # skipped during the walk rather than afterwards.
+    args = ['rg', '-l', '--null', '--fixed-strings', '--iglob', '*.{md,txt}']
+    for literal in literals:
+        args += ['-e', literal]
+    args.append(base_dir)
+
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        yield _read_null_separated(process.stdout)
+    finally:
+        # Leaving early (or an error in the block) ends the search too
+        process.stdout.close()
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+
+def _read_null_separated(stream: BinaryIO) -> Iterator[str]:
+    """Yield the NUL-separated paths ripgrep prints, as they arrive"""
+    pending = b''
+    while chunk := stream.read1(STREAM_BUFFER):
+        *paths, pending = (pending + chunk).split(b'\0')
+        # ripgrep prints paths as the filesystem gave them; fsdecode turns
+        # them back into the str paths os functions expect (undecodable
+        # names included)
+        for path in paths:
+            if path:
+                yield os.fsdecode(path)
+    if pending:
+        yield os.fsdecode(pending)
+
+def _link_literals(node_id: str, name: str) -> List[str]:
+    """Fixed strings that start each link form (see find_links_to_file)"""
+    return [
+        f"[[{node_id} {name}]]",
+        f"[[{node_id}]]",
+        f"[[{node_id} {name}|"
     ]
 
-    matching_files = set()
-    for pattern in patterns:
-        try:
-            # Run ripgrep with the pattern
-            result = subprocess.run(
-                ['rg', '-l', pattern, base_dir],
-                capture_output=True,
-                text=True
-            )
-            if result.stdout:
-                matching_files.update(result.stdout.splitlines())
-        except subprocess.CalledProcessError as e:
-            logging.error("Error running ripgrep: %s", e)
-
-    return list(matching_files)
+def find_links_to_files(
+    base_dir: str,
+    targets: Iterable[Tuple[str, str]]
+) -> Dict[Tuple[str, str], List[str]]:
+    """
+    Find the files linking to each of several (node_id, name) targets with a
+    single ripgrep run, so a batch of renames walks the tree once instead of
+    once per note. ripgrep's JSON output says which literal matched where,
+    which is how the files are attributed back to their targets.
+    """
+    targets = list(dict.fromkeys(targets))
+    found: Dict[Tuple[str, str], List[str]] = {target: [] for target in targets}
+    if not targets:
+        return found
 
-def update_links_in_file(
+    owners: Dict[str, List[Tuple[str, str]]] = {}
+    args = ['rg', '--json', '--fixed-strings', '--iglob', '*.{md,txt}']
+    for target in targets:
+        for literal in _link_literals(*target):
+            if literal not in owners:
+                args += ['-e', literal]
+            owners.setdefault(literal, []).append(target)
+    args.append(base_dir)
+
+    result = subprocess.run(args, capture_output=True)
+
+    # One JSON message per line (newlines inside paths come escaped). Only
+    # match messages matter, and ripgrep always writes their type first, so
+    # the begin/end/summary messages are skipped without being parsed.
+    for line in result.stdout.split(b'\n'):
+        if not line.startswith(b'{"type":"match"'):
+            continue
+        data = json.loads(line)['data']
+        # Paths that aren't valid UTF-8 come back base64-encoded
+        path = data['path']
+        path = path['text'] if 'text' in path else os.fsdecode(base64.b64decode(path['bytes']))
+        for submatch in data['submatches']:
+            for target in owners.get(submatch['match'].get('text'), ()):
+                if not found[target] or found[target][-1] != path:
+                    found[target].append(path)
+    return found
+
+@lru_cache(maxsize=_PATTERN_CACHE_SIZE)
+def _alt_link_pattern(node_id: str, name: str) -> re.Pattern:
+    """
+    Compiled bytes pattern for a link with alt text, [[nodeId name|alt text]].
+    Links don't span lines, and the alt text is matched possessively, so an
+    unterminated "[[nodeId name|" gives up at the end of its line instead of
+    backtracking through the rest of the note.
+    """
+    node_id, name = re.escape(node_id.encode()), re.escape(name.encode())
+    return re.compile(rb"\[\[" + node_id + rb" " + name + rb"\|([^\]\n]*+)\]\]")
+
+@lru_cache(maxsize=_PATTERN_CACHE_SIZE)
+def _link_pattern_bytes(node_id: str, name: str) -> re.Pattern:
+    """
+    Compiled bytes pattern for all three link forms at once: [[nodeId]],
+    [[nodeId name]] (group 1) and [[nodeId name|alt text]] (group 2, with the
+    same line limit as above)
+    """
+    node_id, name = re.escape(node_id.encode()), re.escape(name.encode())
+    return re.compile(rb"\[\[" + node_id + rb"(?:( " + name + rb")(?:\|([^\]\n]*+))?)?\]\]")
+
+def _rewrite_mapped(
     file_path: str,
     old_node_id: str,
     old_name: str,
     new_node_id: str,
     new_name: str
 ) -> bool:
-    """Update all links in a file from old format to new format"""
-    logging.info('=== Updating Links in File ===')
-    logging.info('Parameters: %s', {
-        'file_path': file_path,
-        'old_node_id': old_node_id,
-        'old_name': old_name,
-        'new_node_id': new_node_id,
-        'new_name': new_name
-    })
+    """
+    Update the links in a big note by memory-mapping it and copying the text
+    between links straight from the mapping into a temporary file that
+    replaces the note. Nothing is decoded or held in memory beyond a buffer,
+    and a note without links is left untouched.
+    Returns whether the note was rewritten.
+    """
+    pattern = _link_pattern_bytes(old_node_id, old_name)
+    id_link = f"[[{new_node_id}]]".encode()
+    link = f"[[{new_node_id} {new_name}]]".encode()
+    alt_prefix = f"[[{new_node_id} {new_name}|".encode()
+
+    # The mapping keeps its own handle, so the note itself isn't held open
+    with open(file_path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    with mm:
+        first = pattern.search(mm)
+        if first is None:
+            return False
+        with atomic_writer(file_path, binary=True, buffering=STREAM_BUFFER) as dst:
+            # Slicing the mapping would copy the text; a view writes it straight through
+            with memoryview(mm) as view:
+                # Everything before the first link was already scanned above
+                pos = first.start()
+                dst.write(view[:pos])
+                for match in pattern.finditer(mm, pos):
+                    dst.write(view[pos:match.start()])
+                    if match.group(1) is None:
+                        dst.write(id_link)
+                    elif match.group(2) is None:
+                        dst.write(link)
+                    else:
+                        dst.write(alt_prefix + match.group(2) + b"]]")  # Preserve alt text
+                    pos = match.end()
+                dst.write(view[pos:])
+            # Unmapped before the temporary file replaces the note
+            mm.close()
+    return True
 
+def _link_rewriter(
+    old_node_id: str,
+    old_name: str,
+    new_node_id: str,
+    new_name: str
+) -> Callable[[bytes], bytes]:
+    """
+    Function that updates the links in a note's UTF-8 bytes. Links are
+    matched without decoding the note, and line endings are left as they are.
+    """
+    old_link, new_link = f"[[{old_node_id} {old_name}]]".encode(), f"[[{new_node_id} {new_name}]]".encode()
+    old_id_link, new_id_link = f"[[{old_node_id}]]".encode(), f"[[{new_node_id}]]".encode()
+    old_alt_prefix, alt_prefix = f"[[{old_node_id} {old_name}|".encode(), f"[[{new_node_id} {new_name}|".encode()
+    alt_pattern = _alt_link_pattern(old_node_id, old_name)
+
+    def replace_alt_link(match: re.Match) -> bytes:
+        return alt_prefix + match.group(1) + b"]]"  # Preserve alt text
+
+    def rewrite(text: bytes) -> bytes:
+        # The standard link [[nodeId name]] and ID-only link [[nodeId]] are
+        # plain literals, which bytes.replace finds much faster than the regex
+        # engine; the full form goes first so the ID-only replacement can't
+        # touch it.
+        text = text.replace(old_link, new_link)
+        text = text.replace(old_id_link, new_id_link)
+        # Most notes never give this link alt text; those skip the regex
+        if old_alt_prefix not in text:
+            return text
+        return alt_pattern.sub(replace_alt_link, text)
+
+    return rewrite
+
+def update_links_in_file(
+    file_path: str,
+    old_node_id: str,
+    old_name: str,
+    new_node_id: str,
+    new_name: str
+) -> bool:
+    """
+    Update all links in a file from old format to new format. The file is
+    read once and only written (atomically) if a link actually changed.
+    Returns whether the file was rewritten; errors are logged and count as not.
+    """
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-
-        # Create regex patterns for all link formats
-        old_patterns = [
-            # Standard link: [[nodeId name]]
-            re.escape(f"[[{old_node_id} {old_name}]]"),
-            # ID-only link: [[nodeId]]
-            re.escape(f"[[{old_node_id}]]"),
-            # Link with alt text: [[nodeId name|alt text]]
-            f"\\[\\[{re.escape(old_node_id)} {re.escape(old_name)}\\|([^\\]]*)\\]\\]"
-        ]
-
-        # Replace each pattern
-        for pattern in old_patterns:
-            if '\\|' in pattern:  # Alt text pattern
-                content = re.sub(
-                    pattern,
-                    f"[[{new_node_id} {new_name}|\\1]]",  # Preserve alt text
-                    content
-                )
-            else:  # Standard patterns
-                new_text = f"[[{new_node_id}]]" if pattern.endswith('\\]\\]"') else f"[[{new_node_id} {new_name}]]"
-                content = re.sub(pattern, new_text, content)
-
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+        # The size comes from the open note rather than another lookup of its
+        # path, so a small note is opened just once: the new version goes to
+        # a temporary file that then replaces it (see atomic_write)
+        with open(file_path, 'rb') as f:
+            content = f.read() if os.fstat(f.fileno()).st_size < STREAM_THRESHOLD else None
+
+        if content is None:
+            # Big notes aren't read into memory (nor copied a few more times
+            # while replacing); see _rewrite_mapped
+            return _rewrite_mapped(file_path, old_node_id, old_name, new_node_id, new_name)
+
+        # Every link form starts with "[[nodeId"; a substring test rules
+        # out a note without one far faster than the replacements would
+        # (ripgrep's list can be stale by the time we get here)
+        if f"[[{old_node_id}".encode() not in content:
+            return False
 
+        updated = _link_rewriter(old_node_id, old_name, new_node_id, new_name)(content)
+        if updated == content:
+            return False
+        atomic_write(file_path, updated)
         return True
     except Exception as e:
-        logging.error("Error updating links in %s: %s", file_path, e)
+        logger.error("Error updating links in %s: %s", file_path, e)
         return False
 
 def should_update_links(file_extension: str) -> bool:
     """Check if file type should have its links updated"""
-    logging.info('=== Link Update Check ===')
-    logging.info('File extension: %s', file_extension)
-    supported = file_extension.lower() in ['.md', '.txt']
-    logging.info('Should update links: %s', supported)
-    return supported
+    return file_extension.lower() in ['.md', '.txt']
 
 def rename_and_update_links(
     base_dir: str,
@@ -108,13 +276,23 @@ def rename_and_update_links(
     old_node_id: str,
     old_name: str,
     new_node_id: str,
-    new_name: str
+    new_name: str,
+    linking_files: Optional[List[str]] = None
 ) -> Tuple[bool, List[str]]:
     """
-    Rename a file and update all links to it in other files
+    Rename a file and update all links to it in other files. A batch of
+    renames can look up its linking files in one go (find_links_to_files)
+    and pass each rename its own list instead of searching again.
     Returns: (success, list of updated files)
     """
     try:
+        # Links name a note by ID and name only, so if neither changes (a move,
+        # or a rename event for a metadata touch) there is nothing to search for
+        if (old_node_id, old_name) == (new_node_id, new_name):
+            if old_path != new_path:
+                os.rename(old_path, new_path)
+            return True, []
+
         # Check if we should update links for this file type
         _, file_extension = os.path.splitext(old_path)
         if not should_update_links(file_extension):
@@ -122,28 +300,30 @@ def rename_and_update_links(
             os.rename(old_path, new_path)
             return True, []
 
-        # First find all files containing links to this file
-        affected_files = find_links_to_file(base_dir, old_node_id, old_name)
-
-        # Rename the actual file
-        os.rename(old_path, new_path)
-
-        # Update links in all affected files
-        updated_files = []
-        for file_path in affected_files:
-            # Only update links in supported file types
-            _, ext = os.path.splitext(file_path)
-            if should_update_links(ext):
-                if update_links_in_file(
-                    file_path,
-                    old_node_id,
-                    old_name,
-                    new_node_id,
-                    new_name
-                ):
-                    updated_files.append(file_path)
+        with ExitStack() as stack:
+            # Start looking for files containing links to this file; they are
+            # updated as ripgrep finds them, overlapping its walk with the
+            # updates. ripgrep is stopped again if anything below fails.
+            if linking_files is None:
+                affected_files = stack.enter_context(iter_links_to_file(base_dir, old_node_id, old_name))
+            else:
+                affected_files = linking_files
+
+            # Rename the actual file
+            os.rename(old_path, new_path)
+
+            # Update links in all affected files, one at a time: a note's stable
+            # ID comes from its timestamps, and notes rewritten side by side can
+            # land on the same clock tick and end up sharing one. Only files
+            # whose links actually changed are reported.
+            updated_files = [
+                file_path for file_path in affected_files
+                if update_links_in_file(file_path, old_node_id, old_name, new_node_id, new_name)
+            ]
 
+        logger.info("Renamed %s -> %s, updated links in %d files",
+                    old_path, new_path, len(updated_files))
         return True, updated_files
     except Exception as e:
-        logging.error("Error during rename operation: %s", e)
+        logger.error("Error during rename operation: %s", e)
         return False, []